@@ -0,0 +1,202 @@
+"""Async, read-only twin of the busiest GET endpoints.
+
+Serves the same URLs, payloads and ETags as routes.py, but on SQLAlchemy's
+asyncio extension with asyncpg, so a request waiting on Postgres holds a
+coroutine instead of a gunicorn thread. Writes, auth and everything else stay
+on the Flask app; route GET /api/users, /api/assets, /api/categories and
+/api/requests here at the proxy. Run it from this directory with:
+
+    uvicorn asgi:app --workers 4 --port 5001
+
+Compare the two with bench_http.py.
+"""
+from contextlib import asynccontextmanager
+from functools import wraps
+
+from sqlalchemy import select
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import load_only, raiseload
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.requests import Request as HTTPRequest
+from starlette.responses import Response
+from starlette.routing import Route
+from werkzeug.http import http_date, parse_etags
+
+from conditional import is_fresh, make_etag, summarize, unpack_versions, versions_statement
+from config import Config, check_required
+from models import Asset, Category, Request, User
+from pagination import apply_keyset, parse_limit, split_page
+from queries import REQUEST_INCLUDES, asset_filters, parse_includes, request_filters, serialize_request
+from serializers import to_json
+
+check_required(vars(Config))
+engine = create_async_engine(
+    Config.ASYNC_DATABASE_URI,
+    pool_size=Config.ASYNC_DB_POOL_SIZE,
+    max_overflow=Config.ASYNC_DB_MAX_OVERFLOW,
+    pool_timeout=Config.DB_POOL_TIMEOUT,
+    pool_recycle=Config.DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={'server_settings': {'statement_timeout': str(Config.DB_STATEMENT_TIMEOUT_MS)}},
+)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+class JSONResponse(Response):
+    media_type = 'application/json'
+
+    def render(self, content):
+        return to_json(content)
+
+
+def error(message, status):
+    return JSONResponse({'error': message}, status)
+
+
+def endpoint(*tables):
+    """Give the view a session of its own behind the same check as conditional()."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(request: HTTPRequest):
+            async with Session() as session:
+                rows = await session.execute(versions_statement(tables))
+                versions, last_modified = summarize(unpack_versions(rows, tables))
+                # Same string as Flask's request.full_path, so both servers agree on ETags
+                etag = make_etag(f'{request.url.path}?{request.url.query}', versions)
+                if is_fresh(etag, parse_etags(request.headers.get('if-none-match'))):
+                    response = Response(status_code=304)
+                else:
+                    response = await view(request, session)
+                    if response.status_code != 200:
+                        return response
+            response.headers['ETag'] = f'W/"{etag}"'
+            if last_modified is not None:
+                response.headers['Last-Modified'] = http_date(last_modified)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapped
+    return decorator
+
+
+@endpoint('user')
+async def get_users(request, session):
+    try:
+        serializer = User.serializer.only(request.query_params.get('fields'))
+        limit = parse_limit(request.query_params.get('limit'))
+        query = select(*serializer.columns_with([User.id]))
+        query = apply_keyset(query, [User.id], request.query_params.get('after'), limit)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    users, next_cursor = split_page((await session.execute(query)).all(), limit, key=lambda row: (row.id,))
+    return JSONResponse({'data': [serializer.dump_row(row) for row in users], 'next_cursor': next_cursor})
+
+
+@endpoint('user')
+async def get_user(request, session):
+    try:
+        serializer = User.serializer.only(request.query_params.get('fields'))
+    except ValueError as e:
+        return error(str(e), 400)
+    query = select(*serializer.columns).where(User.id == request.path_params['user_id'])
+    row = (await session.execute(query)).first()
+    if row is None:
+        return error('User not found', 404)
+    return JSONResponse(serializer.dump_row(row))
+
+
+@endpoint('category')
+async def get_categories(request, session):
+    try:
+        serializer = Category.serializer.only(request.query_params.get('fields'))
+    except ValueError as e:
+        return error(str(e), 400)
+    rows = await session.execute(select(*serializer.columns).order_by(Category.id))
+    return JSONResponse({'data': [serializer.dump_row(row) for row in rows]})
+
+
+@endpoint('category')
+async def get_category(request, session):
+    try:
+        serializer = Category.serializer.only(request.query_params.get('fields'))
+    except ValueError as e:
+        return error(str(e), 400)
+    query = select(*serializer.columns).where(Category.id == request.path_params['category_id'])
+    row = (await session.execute(query)).first()
+    if row is None:
+        return error('Category not found', 404)
+    return JSONResponse(serializer.dump_row(row))
+
+
+@endpoint('asset')
+async def get_assets(request, session):
+    args = request.query_params
+    try:
+        serializer = Asset.serializer.only(args.get('fields'))
+        criteria, keys, descending = asset_filters(args)
+        limit = parse_limit(args.get('limit'))
+        query = select(*serializer.columns_with(keys)).where(*criteria)
+        query = apply_keyset(query, keys, args.get('after'), limit, descending)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    assets, next_cursor = split_page(
+        (await session.execute(query)).all(), limit, key=lambda row: tuple(getattr(row, k.key) for k in keys)
+    )
+    return JSONResponse({'data': [serializer.dump_row(row) for row in assets], 'next_cursor': next_cursor})
+
+
+# The validator covers every table ?include= can pull in
+@endpoint('request', 'request_history', 'user', 'asset', 'category')
+async def get_requests(request, session):
+    args = request.query_params
+    try:
+        includes = parse_includes(args.get('include'))
+        serializer = Request.serializer.only(args.get('fields'))
+        query = select(Request).where(*request_filters(args))
+        # Lazy loading cannot run under asyncio at all, so raise rather than try
+        query = query.options(*(REQUEST_INCLUDES[name]() for name in includes), raiseload('*'))
+        if serializer is not Request.serializer:
+            query = query.options(load_only(*serializer.columns_with([Request.id]), raiseload=True))
+        limit = parse_limit(args.get('limit'))
+        query = apply_keyset(query, [Request.id], args.get('after'), limit)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    rows = (await session.execute(query)).scalars().unique().all()
+    requests_, next_cursor = split_page(rows, limit, key=lambda req: (req.id,))
+    return JSONResponse({
+        'data': [serialize_request(req, includes, serializer) for req in requests_],
+        'next_cursor': next_cursor,
+    })
+
+
+async def pool_exhausted(request, exc):
+    # Every pooled connection stayed busy for DB_POOL_TIMEOUT; shed the request
+    return JSONResponse({'msg': 'Server busy, please retry'}, 503, headers={'Retry-After': '1'})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/users', get_users),
+        Route('/api/users/{user_id:int}', get_user),
+        Route('/api/categories', get_categories),
+        Route('/api/categories/{category_id:int}', get_category),
+        Route('/api/assets', get_assets),
+        Route('/api/requests', get_requests),
+    ],
+    exception_handlers={PoolTimeout: pool_exhausted},
+    # gzip only; serve brotli from the Flask app or the proxy if it matters here
+    middleware=[Middleware(GZipMiddleware, minimum_size=Config.COMPRESS_MIN_SIZE,
+                           compresslevel=Config.COMPRESS_LEVEL)] if Config.COMPRESS_ENABLED else [],
+    lifespan=lifespan,
+)
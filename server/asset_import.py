@@ -0,0 +1,210 @@
+"""Bulk asset import from CSV or NDJSON.
+
+Rows are read and validated one at a time, COPYed into a temporary staging
+table in batches, then merged into `asset` with a single INSERT ... SELECT in
+the caller's transaction. Memory use is bounded by the batch size and the
+error report cap, not by the size of the file.
+
+Each row has `name` and either `category` (a category name, matched without
+regard to case) or `category_id`; `description`, `image_url`, `status`
+(default Available) and `allocated_to` (a user id, required for Allocated)
+are optional. CSV files name these columns in their header row.
+"""
+import codecs
+import csv
+import heapq
+import itertools
+import re
+
+import psycopg2
+from flask import current_app
+from sqlalchemy import text
+
+from database import db
+from db_copy import copy_rows
+from models import Asset, AssetStatus, Category
+
+FIELDS = {'name', 'description', 'category', 'category_id', 'status', 'image_url', 'allocated_to'}
+FORMATS = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson'}
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+NAME_LENGTH = Asset.name.type.length
+# Limits of the asset columns, checked by validate() so that no valid row can
+# fail inside the COPY; None for unbounded text
+TEXT_LENGTHS = {field: getattr(Asset, field).type.length for field in ('description', 'image_url')}
+INTEGER_MAX = 2 ** 31 - 1
+COPY_LINE = re.compile(r'COPY asset_import, line (\d+)')
+
+STAGING_COLUMNS = ['line', 'name', 'description', 'category_id', 'status', 'image_url', 'allocated_to']
+STAGING_TABLE = f'''
+    CREATE TEMPORARY TABLE asset_import (
+        line integer NOT NULL,
+        name text NOT NULL,
+        description text,
+        category_id integer NOT NULL,
+        status {Asset.status.type.name} NOT NULL,
+        image_url text,
+        allocated_to integer
+    ) ON COMMIT DROP
+'''
+
+
+def _decode(lines):
+    try:
+        yield from codecs.iterdecode(lines, 'utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError('Body is not valid UTF-8')
+
+
+def read_csv(lines):
+    """(line number, record) pairs from CSV `lines` (bytes) with a header row."""
+    reader = csv.DictReader(_decode(lines))
+    try:
+        unknown = set(reader.fieldnames or ()) - FIELDS
+        if unknown:
+            raise ValueError(f"Unknown column: {', '.join(sorted(unknown))}")
+        for record in reader:
+            # Missing trailing cells come back as None and extra ones under None
+            if None in record:
+                yield reader.line_num, 'Too many cells'
+                continue
+            yield reader.line_num, {key: value for key, value in record.items() if value not in ('', None)}
+    except csv.Error as e:
+        # e.g. a field over csv.field_size_limit(); the reader cannot go on past it
+        raise ValueError(f'Malformed CSV after line {reader.line_num}: {e}')
+
+
+def read_ndjson(lines):
+    """(line number, record) pairs from NDJSON `lines` (bytes), one object per line."""
+    loads = current_app.json.loads
+    for number, line in enumerate(_decode(lines), 1):
+        if not line.strip():
+            continue
+        try:
+            record = loads(line)
+        except ValueError:
+            yield number, 'Invalid JSON'
+            continue
+        if not isinstance(record, dict):
+            yield number, 'Expected a JSON object'
+            continue
+        yield number, {key: value for key, value in record.items() if value not in ('', None)}
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def _integer(record, field):
+    value = record.get(field)
+    if value is None:
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f'{field} must be an integer')
+    if abs(value) > INTEGER_MAX:
+        raise ValueError(f'{field} is out of range')
+    return value
+
+
+def validate(record, categories):
+    """Staging values for one record, or ValueError saying what is wrong with it.
+
+    `categories` maps casefolded names and ids to category ids.
+    """
+    if isinstance(record, str):
+        raise ValueError(record)
+    unknown = record.keys() - FIELDS
+    if unknown:
+        raise ValueError(f"Unknown field: {', '.join(sorted(unknown))}")
+    for field in ('name', 'description', 'category', 'status', 'image_url'):
+        if field in record and not isinstance(record[field], str):
+            raise ValueError(f'{field} must be a string')
+        if field in record and '\x00' in record[field]:
+            raise ValueError(f'{field} must not contain NUL characters')
+    for field, length in TEXT_LENGTHS.items():
+        if length is not None and len(record.get(field, '')) > length:
+            raise ValueError(f'{field} must be at most {length} characters')
+
+    name = (record.get('name') or '').strip()
+    if not name or len(name) > NAME_LENGTH:
+        raise ValueError(f'name must be 1-{NAME_LENGTH} characters')
+
+    if 'category' in record:
+        category_id = categories.get(record['category'].strip().casefold())
+        if category_id is None:
+            raise ValueError(f"Unknown category: {record['category']}")
+    else:
+        category_id = categories.get(_integer(record, 'category_id'))
+        if category_id is None:
+            raise ValueError('category or a known category_id is required')
+
+    status = record.get('status', AssetStatus.Available.value)
+    if status not in AssetStatus.__members__:
+        raise ValueError(f'Unknown status: {status}')
+    allocated_to = _integer(record, 'allocated_to')
+    if (status == AssetStatus.Allocated.value) != (allocated_to is not None):
+        raise ValueError('allocated_to is required for, and only allowed with, status Allocated')
+
+    return name, record.get('description'), category_id, status, record.get('image_url'), allocated_to
+
+
+def _copy(cursor, batch):
+    try:
+        copy_rows(cursor, 'asset_import', STAGING_COLUMNS, batch)
+    except psycopg2.DataError as e:
+        # validate() should have refused the row; still say which one it was
+        match = COPY_LINE.search(e.diag.context or '')
+        where = f'line {batch[int(match.group(1)) - 1][0]}: ' if match else ''
+        raise ValueError(f'{where}{e.diag.message_primary}')
+
+
+def import_assets(lines, fmt, batch_size=BATCH_SIZE, max_errors=MAX_REPORTED_ERRORS):
+    """Validate and merge assets from `lines` in `fmt` ('csv' or 'ndjson').
+
+    Valid rows are inserted in the current transaction; the caller commits.
+    Returns {'imported', 'rejected', 'errors'} where errors lists the first
+    `max_errors` rejected rows by line number. Raises ValueError when the
+    input as a whole is unusable (bad header, bad encoding), or when a row
+    fails to load.
+    """
+    categories = {}
+    for category_id, name in db.session.query(Category.id, Category.category_name):
+        categories[name.casefold()] = categories[category_id] = category_id
+
+    db.session.execute(text(STAGING_TABLE))
+    cursor = db.session.connection().connection.driver_connection.cursor()
+    invalid, rejected, batch = [], 0, []
+    for line, record in READERS[fmt](lines):
+        try:
+            batch.append((line, *validate(record, categories)))
+        except ValueError as e:
+            rejected += 1
+            if len(invalid) < max_errors:
+                invalid.append({'line': line, 'error': str(e)})
+            continue
+        if len(batch) >= batch_size:
+            _copy(cursor, batch)
+            batch = []
+    if batch:
+        _copy(cursor, batch)
+
+    # Holders can only be checked against the database, so once, in bulk
+    unknown_holder = 'allocated_to IS NOT NULL AND NOT EXISTS (SELECT 1 FROM "user" u WHERE u.id = s.allocated_to)'
+    unknown = [
+        {'line': line, 'error': f'Unknown user: {user_id}'}
+        for line, user_id in db.session.execute(
+            text(f'SELECT line, allocated_to FROM asset_import s WHERE {unknown_holder} ORDER BY line LIMIT :n'),
+            {'n': max_errors})
+    ]
+    rejected += db.session.execute(text(f'DELETE FROM asset_import s WHERE {unknown_holder}')).rowcount
+    # Both lists are the first max_errors of their kind in line order, so the
+    # first max_errors of their merge are the first of all rejected rows
+    errors = list(itertools.islice(heapq.merge(invalid, unknown, key=lambda error: error['line']), max_errors))
+
+    imported = db.session.execute(text('''
+        INSERT INTO asset (name, description, category_id, status, image_url, allocated_to, created_at, updated_at)
+        SELECT name, description, category_id, status, image_url, allocated_to, now(), now()
+        FROM asset_import ORDER BY line
+    ''')).rowcount
+    return {'imported': imported, 'rejected': rejected, 'errors': errors}
@@ -0,0 +1,94 @@
+"""Login and registration, registered by create_app() in app.py."""
+import logging
+
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import create_access_token
+
+from models import User
+from database import db
+from hashing import HashPoolBusy, hasher
+
+logger = logging.getLogger(__name__)
+
+auth_bp = Blueprint('auth', __name__)
+
+def server_busy():
+    return jsonify({'msg': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
+
+@auth_bp.route('/api/login', methods=['POST'])
+def login():
+    data = request.json  # Get JSON data from request
+
+    username = data.get('username')
+    password = data.get('password')
+
+    user = User.query.filter_by(username=username).first()
+
+    if user:
+        try:
+            valid = hasher.verify(user.password, password)
+        except HashPoolBusy:
+            return server_busy()
+        if valid:
+            if hasher.needs_rehash(user.password):
+                # Upgrade weaker hashes while we still hold the plaintext
+                try:
+                    user.password = hasher.hash(password)
+                    db.session.commit()
+                except HashPoolBusy:
+                    pass
+            # Create access token with serializable user information
+            access_token = create_access_token(identity={
+                'id': user.id,
+                'username': user.username,
+                'role': user.role.name if user.role else None
+            })
+            logger.info('Login succeeded', extra={'user_id': user.id})
+            return jsonify(access_token=access_token), 200
+        else:
+            logger.info('Login failed', extra={'username': username})
+            return jsonify({'msg': 'Bad username or password'}), 401
+    else:
+        logger.info('Login failed', extra={'username': username})
+        return jsonify({'msg': 'Bad username or password'}), 401
+    
+@auth_bp.route('/api/logout', methods=['POST'])
+def logout():
+    return jsonify({'message': 'Logged out successfully'})
+
+@auth_bp.route('/api/register', methods=['POST'])
+def register():
+    data = request.get_json()
+
+    # Extract data with validation
+    username = data.get('username')
+    password = data.get('password')
+    role = data.get('role')
+    email = data.get('email')
+
+    if not username or not password or not role or not email:
+        return jsonify({'msg': 'Missing required fields'}), 400
+
+    # Check if user already exists
+    user = User.query.filter_by(username=username).first()
+    if user:
+        return jsonify({'msg': 'User already exists'}), 400
+
+    # Hash the password
+    try:
+        hashed_password = hasher.hash(password)
+    except HashPoolBusy:
+        return server_busy()
+
+    # Create a new user
+    new_user = User(username=username, password=hashed_password, role=role, email=email)
+    db.session.add(new_user)
+
+    try:
+        db.session.commit()
+        logger.info('User registered', extra={'user_id': new_user.id, 'role': role})
+        return jsonify({'message': 'User created successfully', 'role': role}), 201
+    except Exception:
+        db.session.rollback()
+        logger.exception('Failed to create user %s', username)
+        return jsonify({'msg': 'Failed to create user'}), 500
@@ -0,0 +1,505 @@
+"""HTTP load generator and benchmark suite.
+
+`run` loads servers that are already up, e.g. to compare the Flask app with
+the async read path (asgi.py) on the same database:
+
+    gunicorn --workers 4 --threads 8 --bind 127.0.0.1:5000
+    uvicorn asgi:app --workers 4 --port 5001
+    python bench_http.py run --target flask=http://127.0.0.1:5000 \\
+        --target asgi=http://127.0.0.1:5001 --concurrency 1000 --processes 4
+
+`suite` is the repeatable version for catching regressions. It reseeds the
+configured database to a fixed size (--reseed; this TRUNCATEs it), starts
+gunicorn, drives every scenario in SUITE, writes the numbers to a JSON file
+and exits non-zero when a metric is worse than the baseline by more than
+--threshold:
+
+    python bench_http.py suite --reseed --save-baseline bench-baseline.json
+    ... change something ...
+    python bench_http.py suite --baseline bench-baseline.json --out bench-results.json
+
+`startup` times what a new process pays before it serves: `import app`,
+create_app() and the first two requests, each in fresh interpreters, plus
+the `flask` CLI and a gunicorn worker booting and respawning with and
+without preload_app. It takes the same --out/--baseline options:
+
+    python bench_http.py startup --repeat 10 --baseline startup-baseline.json
+
+Only compare results from the same machine. The generator needs CPU too: give
+it its own cores (or machine) and enough --processes that it is not the
+bottleneck.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Database size the suite seeds; the workloads pick users and ids from it
+SEED_SIZE = {'users': 10000, 'categories': 8, 'assets': 100000, 'requests': 100000}
+SEED_PASSWORD = 'password'
+
+# name -> [(weight, kind, path)]; see _build_request for the kinds
+WORKLOADS = {
+    'read_mix': [
+        (1, 'get', '/api/users?limit=50'),
+        (1, 'get', '/api/assets?limit=50'),
+        (1, 'get', '/api/assets?status=Available&limit=50'),
+        (1, 'get', '/api/categories'),
+        (1, 'get', '/api/requests?limit=50&include=user,asset'),
+    ],
+    # Front ends re-polling with the ETag of their last response
+    'list_polling': [
+        (4, 'poll', '/api/users?limit=50'),
+        (3, 'poll', '/api/users/{user_id}'),
+        (2, 'poll', '/api/assets?limit=50'),
+        (1, 'poll', '/api/requests?limit=50&include=user'),
+    ],
+    'login_storm': [(1, 'login', '/api/login')],
+    'registration_burst': [(1, 'register', '/api/register')],
+}
+
+# (workload, concurrent clients, seconds) run by `suite`
+SUITE = [
+    ('list_polling', 50, 20),
+    ('list_polling', 500, 20),
+    ('read_mix', 50, 20),
+    ('login_storm', 20, 20),
+    ('registration_burst', 20, 20),
+]
+
+# Metrics the regression gate checks, and which direction is better
+GATED = {'rps': 'higher', 'p50_ms': 'lower', 'p95_ms': 'lower', 'p99_ms': 'lower'}
+
+# Run by `startup` in a fresh interpreter per sample, so that nothing is
+# imported or warm yet; prints the milliseconds of each of STARTUP_PHASES
+STARTUP_PROBE = '''
+import json, sys, time
+marks = [time.perf_counter()]
+import app
+marks.append(time.perf_counter())
+application = app.create_app(cli=False)
+marks.append(time.perf_counter())
+client = application.test_client()
+for _ in range(2):
+    status = client.get(sys.argv[1]).status_code
+    if status != 200:
+        sys.exit(f'GET {sys.argv[1]} returned {status}')
+    marks.append(time.perf_counter())
+print(json.dumps([(end - start) * 1000 for start, end in zip(marks, marks[1:])]))
+'''
+STARTUP_PHASES = ['import', 'create_app', 'first_request', 'second_request']
+STARTUP_GATED = {'median_ms': 'lower'}
+
+
+def _build_request(rng, kind, path, etags, counter):
+    """(method, path, extra headers, JSON body or None) for one request."""
+    path = path.format(user_id=rng.randint(1, SEED_SIZE['users']))
+    if kind == 'get':
+        return 'GET', path, {}, None
+    if kind == 'poll':
+        return 'GET', path, {'If-None-Match': etags[path]} if path in etags else {}, None
+    if kind == 'login':
+        username = f"user{rng.randint(1, SEED_SIZE['users']):07d}"
+        return 'POST', path, {}, {'username': username, 'password': SEED_PASSWORD}
+    if kind == 'register':
+        username = f'bench-{os.getpid()}-{next(counter)}-{rng.getrandbits(32):08x}'
+        return 'POST', path, {}, {'username': username, 'password': SEED_PASSWORD,
+                                  'email': f'{username}@example.com', 'role': 'Employee'}
+    raise ValueError(f'Unknown request kind: {kind}')
+
+
+async def _read_response(reader):
+    """Consume one response; returns (status, ETag or None, server closes the connection)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed by server')
+    status = int(status_line.split()[1])
+    length, chunked, close, etag = 0, False, False, None
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value.lower()
+        elif name == 'connection':
+            close = value.lower() == 'close'
+        elif name == 'etag':
+            etag = value
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status, etag, close
+
+
+async def _client(host, port, workload, deadline, latencies, statuses):
+    rng = random.Random()
+    counter = itertools.count()
+    weights = [weight for weight, _, _ in workload]
+    etags = {}
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        _, kind, template = rng.choices(workload, weights)[0]
+        method, path, headers, body = _build_request(rng, kind, template, etags, counter)
+        payload = b'' if body is None else json.dumps(body).encode()
+        if body is not None:
+            headers.update({'Content-Type': 'application/json', 'Content-Length': str(len(payload))})
+        head = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        close = True
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nAccept: application/json\r\n{head}\r\n'
+                         .encode() + payload)
+            await writer.drain()
+            status, etag, close = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if etag:
+                etags[path] = etag
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+            await asyncio.sleep(0.05)
+        if close and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _run(url, workload, concurrency, duration):
+    parts = urlsplit(url)
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        _client(parts.hostname, parts.port or 80, workload, deadline, latencies, statuses)
+        for _ in range(concurrency)
+    ))
+    return latencies, statuses
+
+
+def _worker(args):
+    # 1k sockets is more than the usual default soft limit
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return asyncio.run(_run(*args))
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def measure(url, workload, concurrency, duration, processes=1):
+    """Load `url` with `workload` and return a summary dict (latencies in milliseconds)."""
+    processes = max(1, min(processes, concurrency))
+    shares = [concurrency // processes + (i < concurrency % processes) for i in range(processes)]
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(_worker, [(url, workload, share, duration) for share in shares])
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    statuses = {}
+    for _, result_statuses in results:
+        for key, count in result_statuses.items():
+            statuses[str(key)] = statuses.get(str(key), 0) + count
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for key, count in statuses.items() if not key.isdigit() or int(key) >= 400),
+        'statuses': statuses,
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+    }
+
+
+def compare(results, baseline, threshold, gated=GATED):
+    """Human-readable regressions of `results` against `baseline` in the `gated` metrics."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, better in gated.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change < -threshold) if better == 'higher' else (change > threshold):
+                regressions.append(f'{name} {metric}: {old} -> {new} ({change:+.0%})')
+    return regressions
+
+
+def print_table(results):
+    print(f"{'scenario':<28} {'requests':>9} {'errors':>7} {'req/s':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, r in results.items():
+        print(f"{name:<28} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9} "
+              f"{r['p50_ms']!s:>9} {r['p95_ms']!s:>9} {r['p99_ms']!s:>9} {r['max_ms']!s:>9}")
+
+
+def _flask(*args):
+    subprocess.run([sys.executable, '-m', 'flask', *args], cwd=SERVER_DIR, check=True,
+                   env={**os.environ, 'FLASK_APP': 'app'})
+
+
+def _wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}')
+        try:
+            with urllib.request.urlopen(url + '/', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.25)
+    raise RuntimeError(f'{url} did not come up within {timeout}s')
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    if args.reseed:
+        print(f'Reseeding the database with {SEED_SIZE} ...', flush=True)
+        _flask('seed', '--truncate', '--password', SEED_PASSWORD,
+               *itertools.chain.from_iterable((f'--{key}', str(value)) for key, value in SEED_SIZE.items()))
+
+    url = f'http://127.0.0.1:{args.port}'
+    server = subprocess.Popen(
+        ['gunicorn', '--bind', f'127.0.0.1:{args.port}', '--workers', str(args.workers),
+         '--threads', str(args.threads)],
+        cwd=SERVER_DIR, env={**os.environ, 'WEB_CONCURRENCY': str(args.workers),
+                             'GUNICORN_THREADS': str(args.threads)},
+    )
+    results = {}
+    try:
+        _wait_until_up(url, server)
+        for workload, concurrency, duration in SUITE:
+            if args.only and workload not in args.only:
+                continue
+            name = f'{workload}@{concurrency}'
+            print(f'{name} for {args.duration or duration}s ...', flush=True)
+            results[name] = measure(url, WORKLOADS[workload], concurrency, args.duration or duration,
+                                    args.processes)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    print_table(results)
+    _report(args, results, GATED, workers=args.workers, threads=args.threads, seed_size=SEED_SIZE)
+
+
+def _report(args, results, gated, **meta):
+    """Write `results` to --out/--save-baseline and exit non-zero if any request
+    failed or they regressed against --baseline."""
+    report = {
+        'meta': {
+            'revision': _git_revision(),
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'cpu_count': os.cpu_count(),
+            **meta,
+        },
+        'results': results,
+    }
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Wrote {path}')
+
+    # Requests failing fast would otherwise pass as a speed-up
+    failed = {name: result for name, result in results.items() if result.get('errors')}
+    for name, result in failed.items():
+        print(f"FAILED {name}: {result['errors']} of {result['requests']} requests failed {result['statuses']}")
+    if failed:
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold, gated)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print(f'No metric regressed by more than {args.threshold:.0%} against {args.baseline}.')
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {'runs': len(samples), 'median_ms': round(samples[len(samples) // 2], 1),
+            'min_ms': round(samples[0], 1), 'max_ms': round(samples[-1], 1)}
+
+
+def _ms_until_ok(url, process, started, timeout=60):
+    """Milliseconds from `started` until `url` answers 200."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}')
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return (time.perf_counter() - started) * 1000
+        except OSError:
+            time.sleep(0.005)
+    raise RuntimeError(f'{url} did not answer within {timeout}s')
+
+
+def measure_gunicorn(port, path, preload):
+    """(boot, respawn) milliseconds of a one-worker gunicorn.
+
+    Boot runs from starting gunicorn to the first answer to `path`, respawn
+    from killing the worker to the first answer of its replacement.
+    """
+    url = f'http://127.0.0.1:{port}{path}'
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        ['gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', '1', '--threads', '1'],
+        cwd=SERVER_DIR, env={**os.environ, 'WEB_CONCURRENCY': '1', 'GUNICORN_THREADS': '1',
+                             'GUNICORN_PRELOAD': str(preload).lower(), 'LOG_LEVEL': 'WARNING'},
+    )
+    try:
+        boot = _ms_until_ok(url, server, started)
+        worker = subprocess.run(['pgrep', '-P', str(server.pid)], capture_output=True, text=True, check=True)
+        started = time.perf_counter()
+        os.kill(int(worker.stdout.split()[0]), signal.SIGKILL)
+        respawn = _ms_until_ok(url, server, started)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    return boot, respawn
+
+
+def run_startup(args):
+    samples = {phase: [] for phase in STARTUP_PHASES}
+    # Quiet, and without sampled access log lines in the timed requests
+    env = {**os.environ, 'LOG_LEVEL': 'WARNING'}
+    for run in range(args.repeat):
+        print(f'Run {run + 1}/{args.repeat} ...', flush=True)
+        probe = subprocess.run([sys.executable, '-c', STARTUP_PROBE, args.path], cwd=SERVER_DIR, env=env,
+                               capture_output=True, text=True)
+        if probe.returncode:
+            sys.exit(f'Startup probe failed:\n{probe.stderr}')
+        for phase, elapsed in zip(STARTUP_PHASES, json.loads(probe.stdout.splitlines()[-1])):
+            samples[phase].append(elapsed)
+
+        # The whole process, interpreter start included
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', '--help'], cwd=SERVER_DIR, env=env,
+                       capture_output=True, check=True)
+        samples.setdefault('flask_cli', []).append((time.perf_counter() - started) * 1000)
+
+        if not args.no_gunicorn:
+            for preload in (False, True):
+                label = 'preload' if preload else 'no_preload'
+                boot, respawn = measure_gunicorn(args.port, args.path, preload)
+                samples.setdefault(f'gunicorn_boot[{label}]', []).append(boot)
+                samples.setdefault(f'worker_respawn[{label}]', []).append(respawn)
+
+    results = {phase: _summary(values) for phase, values in samples.items()}
+    print(f"{'phase':<28} {'runs':>5} {'median ms':>10} {'min ms':>9} {'max ms':>9}")
+    for phase, r in results.items():
+        print(f"{phase:<28} {r['runs']:>5} {r['median_ms']:>10} {r['min_ms']:>9} {r['max_ms']:>9}")
+    _report(args, results, STARTUP_GATED, path=args.path)
+
+
+def run_targets(args):
+    if args.paths:
+        workload = [(1, 'get', path) for path in args.paths]
+    else:
+        workload = WORKLOADS[args.workload]
+    results = {}
+    for target in args.target:
+        name, _, url = target.partition('=')
+        if not url:
+            name = url = target
+        results[name] = measure(url, workload, args.concurrency, args.duration, args.processes)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Load servers that are already running')
+    run.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                     help='Server to load; repeat to compare several')
+    run.add_argument('--workload', choices=sorted(WORKLOADS), default='read_mix')
+    run.add_argument('--path', action='append', dest='paths', metavar='PATH',
+                     help='GET this path instead of a workload, picked at random per request; repeatable')
+    run.add_argument('--concurrency', type=int, default=1000)
+    run.add_argument('--duration', type=float, default=30)
+    run.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    run.add_argument('--json', action='store_true', help='Print the results as JSON')
+    run.set_defaults(handler=run_targets)
+
+    suite = commands.add_parser('suite', help='Start gunicorn and run every scenario in SUITE')
+    suite.add_argument('--reseed', action='store_true',
+                       help='TRUNCATE the configured database and seed it to SEED_SIZE first')
+    suite.add_argument('--port', type=int, default=5055)
+    suite.add_argument('--workers', type=int, default=2)
+    suite.add_argument('--threads', type=int, default=8)
+    suite.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    suite.add_argument('--duration', type=float, help='Override every scenario duration (seconds)')
+    suite.add_argument('--only', action='append', choices=sorted(WORKLOADS), help='Run just these workloads')
+    suite.add_argument('--out', help='Write the results to this JSON file')
+    suite.add_argument('--baseline', help='Fail when results regress against this results file')
+    suite.add_argument('--save-baseline', metavar='PATH', help='Also write the results here as the new baseline')
+    suite.add_argument('--threshold', type=float, default=0.15,
+                       help='Allowed relative change before a metric counts as regressed')
+    suite.set_defaults(handler=run_suite)
+
+    startup = commands.add_parser('startup', help='Time imports, create_app(), first requests and gunicorn boot')
+    startup.add_argument('--path', default='/api/categories', help='GET this path as the first requests')
+    startup.add_argument('--repeat', type=int, default=5, help='Fresh processes per measurement')
+    startup.add_argument('--port', type=int, default=5056)
+    startup.add_argument('--no-gunicorn', action='store_true', help='Skip the gunicorn boot and respawn timings')
+    startup.add_argument('--out', help='Write the results to this JSON file')
+    startup.add_argument('--baseline', help='Fail when results regress against this results file')
+    startup.add_argument('--save-baseline', metavar='PATH', help='Also write the results here as the new baseline')
+    startup.add_argument('--threshold', type=float, default=0.25,
+                         help='Allowed relative change before a median counts as regressed')
+    startup.set_defaults(handler=run_startup)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
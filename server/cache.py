@@ -0,0 +1,204 @@
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge
+
+from replicas import primary
+
+logger = logging.getLogger(__name__)
+
+# Must match the triggers in migration 4e23267ffb87
+CHANNEL = 'cache_invalidate'
+# Key under which a region caches its whole listing
+ALL = '*'
+
+CACHE_HITS = Counter('cache_hits_total', 'Reference cache hits', ['region'])
+CACHE_MISSES = Counter('cache_misses_total', 'Reference cache misses', ['region'])
+CACHE_EVICTIONS = Counter('cache_evictions_total', 'Entries dropped for size or age', ['region'])
+CACHE_INVALIDATIONS = Counter('cache_invalidations_total', 'Entries dropped on a NOTIFY', ['region'])
+CACHE_ENTRIES = Gauge('cache_entries', 'Entries held by the reference cache', multiprocess_mode='livesum')
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU map whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """(True, value) on a hit, (False, None) otherwise."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+                self.evictions += 1
+                CACHE_EVICTIONS.labels(key[0]).inc()
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                (region, _), _ = self._data.popitem(last=False)
+                self.evictions += 1
+                CACHE_EVICTIONS.labels(region).inc()
+
+    def discard(self, match):
+        """Drop every key for which `match(key)` is true."""
+        with self._lock:
+            doomed = [key for key in self._data if match(key)]
+            for key in doomed:
+                del self._data[key]
+                CACHE_INVALIDATIONS.labels(key[0]).inc()
+            self.invalidations += len(doomed)
+
+    def clear(self):
+        self.discard(lambda key: True)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+class ReferenceCache:
+    """Per-process read-through cache for rarely written rows (users, categories).
+
+    Entries are keyed by (region, key) where the region is a table name.
+    Triggers on the cached tables NOTIFY on commit, and a listener thread in
+    each worker drops the matching entries, so a write reaches every gunicorn
+    worker within one round trip. Until that listener is connected the cache
+    is bypassed entirely; CACHE_TTL only bounds the damage of a bug.
+    """
+
+    def __init__(self, app=None, db=None):
+        self._pid = None
+        self._pid_lock = threading.Lock()
+        self._listening = False
+        # Bumped on every invalidation; a load that overlapped one is not stored
+        self._generation = 0
+        self.store = LRUCache(1, 0)
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('CACHE_ENABLED', True)
+        app.config.setdefault('CACHE_MAX_ENTRIES', 10000)
+        app.config.setdefault('CACHE_TTL', 300)
+        self.db = db
+        self.enabled = app.config['CACHE_ENABLED']
+        self.store = LRUCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_TTL'])
+        app.extensions['cache'] = self
+
+    def get(self, region, key, load):
+        """Cached value for (region, key), calling `load()` on a miss.
+
+        `None` results are not cached. Values are shared between requests,
+        so callers must not mutate them.
+        """
+        if not self.enabled or not self._ensure_listener():
+            return load()
+        hit, value = self.store.get((region, key))
+        if hit:
+            CACHE_HITS.labels(region).inc()
+            return value
+        CACHE_MISSES.labels(region).inc()
+        generation = self._generation
+        # Invalidations come from the primary, so a lagging replica could
+        # hand back the very row that was just invalidated
+        with primary():
+            value = load()
+        if value is not None and generation == self._generation:
+            self.store.put((region, key), value)
+        CACHE_ENTRIES.set(len(self.store))
+        return value
+
+    def invalidate(self, region, key=None):
+        """Drop (region, key) and the region's listing, or the whole region."""
+        self._generation += 1
+        if key is None:
+            self.store.discard(lambda k: k[0] == region)
+        else:
+            self.store.discard(lambda k: k[0] == region and k[1] in (key, ALL))
+        # The table's write version (conditional.py) changes with any row
+        self.store.discard(lambda k: k == ('table_version', region))
+        CACHE_ENTRIES.set(len(self.store))
+
+    def snapshot(self):
+        return {'enabled': self.enabled, 'listening': self._listening, **self.store.snapshot()}
+
+    def _ensure_listener(self):
+        # One listener per process: the thread does not survive a gunicorn fork
+        if self._pid != os.getpid():
+            with self._pid_lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._listening = False
+                    self.store.clear()
+                    threading.Thread(target=self._listen, args=(self.db.engine,), name='cache-listener',
+                                     daemon=True).start()
+        return self._listening
+
+    def _listen(self, engine):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                raw = engine.raw_connection()
+                conn = raw.driver_connection
+                # Keep the connection for good without holding a pool slot
+                raw.detach()
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                # Anything written while nobody was listening may be cached
+                self.store.clear()
+                self._generation += 1
+                self._listening = True
+                backoff = 1
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        conn.cursor().execute('SELECT 1')  # notice a dead server
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0).payload)
+            except Exception:
+                logger.exception('Cache listener lost its connection; bypassing the cache')
+            self._listening = False
+            if conn is not None and not conn.closed:
+                conn.close()
+            self.store.clear()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _dispatch(self, payload):
+        region, _, key = payload.partition(':')
+        self.invalidate(region, int(key) if key else None)
+
+
+cache = ReferenceCache()
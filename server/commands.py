@@ -0,0 +1,395 @@
+"""`flask` CLI commands, registered by create_app() in app.py."""
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+
+import click
+from flask import Blueprint, current_app
+from sqlalchemy import insert, text
+
+from models import Asset, AssetStatus, Category, Job, Request, User, UserRole
+from database import db
+import asset_import
+import dashboard
+import jobs
+import seed
+from hashing import hasher
+from replicas import reading
+from pagination import apply_keyset
+from routes import build_asset_query
+from search import asset_search
+from sql_debug import QueryBudgetExceeded, assert_max_queries
+
+
+commands_bp = Blueprint('commands', __name__, cli_group=None)
+
+# CLI command to show the database state (optional)
+@commands_bp.cli.command("show_users")
+def show_users():
+    """Displays all users in the database."""
+    with reading():
+        users = User.query.all()
+        for user in users:
+            print(user.serialize)
+
+@commands_bp.cli.command("create_history_partitions")
+@click.option('--months-ahead', default=3, help='Future months to create partitions for.')
+def create_history_partitions(months_ahead):
+    """Creates missing monthly request_history partitions; run from cron."""
+    created = db.session.execute(
+        text('SELECT request_history_ensure_partitions(current_date, :months)'),
+        {'months': months_ahead + 1},
+    ).scalar()
+    db.session.commit()
+    print(f"Created {created} request_history partition(s).")
+
+@commands_bp.cli.command("seed")
+@click.option('--users', default=1000, help='Users to create.')
+@click.option('--categories', default=len(seed.CATEGORIES), help='Categories to create.')
+@click.option('--assets', default=10000, help='Assets to create.')
+@click.option('--requests', default=10000, help='Requests to create, each with its history chain.')
+@click.option('--seed', 'random_seed', default=42, help='RNG seed; the same seed gives the same rows.')
+@click.option('--batch-size', default=50000, help='Rows per COPY statement.')
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']), default='2025-01-01',
+              help='First day of the generated timestamps.')
+@click.option('--days', default=365, help='Days the generated timestamps span.')
+@click.option('--password', default='password', help='Password every generated user gets.')
+@click.option('--truncate', is_flag=True, help='Empty the seeded tables first (destroys their data).')
+def seed_command(users, categories, assets, requests, random_seed, batch_size, start, days, password, truncate):
+    """Appends a deterministic synthetic dataset, loaded with COPY."""
+    try:
+        seed.generate(users, categories, assets, requests, random_seed, batch_size,
+                      start.date(), days, password, truncate)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    print(f"Seeded {users} users, {categories} categories, {assets} assets and {requests} requests; "
+          f"every user's password is {password!r}.")
+
+@commands_bp.cli.command("import_assets")
+@click.argument('source', type=click.File('rb'))
+@click.option('--format', 'fmt', type=click.Choice(sorted(asset_import.READERS)),
+              help='Input format; guessed from the file extension when omitted.')
+@click.option('--batch-size', default=asset_import.BATCH_SIZE, help='Rows per COPY into the staging table.')
+@click.option('--max-errors', default=asset_import.MAX_REPORTED_ERRORS, help='Rejected rows to list.')
+def import_assets_command(source, fmt, batch_size, max_errors):
+    """Imports assets from a CSV or NDJSON file ('-' reads stdin)."""
+    fmt = fmt or {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}.get(os.path.splitext(source.name)[1])
+    if fmt is None:
+        raise click.UsageError('Pass --format; it cannot be guessed from the file name')
+    try:
+        report = asset_import.import_assets(source, fmt, batch_size, max_errors)
+        db.session.commit()
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    for error in report['errors']:
+        print(f"line {error['line']}: {error['error']}")
+    print(f"Imported {report['imported']} assets, rejected {report['rejected']}.")
+
+@commands_bp.cli.command("worker")
+@click.option('--processes', type=int, help='Worker processes; defaults to JOB_WORKERS.')
+def worker(processes):
+    """Runs background jobs until stopped with SIGTERM or Ctrl-C."""
+    app = current_app._get_current_object()
+    processes = processes or app.config['JOB_WORKERS']
+    print(f"Starting {processes} job workers for: {', '.join(sorted(jobs.HANDLERS))}")
+    jobs.run_workers(app, processes)
+
+@commands_bp.cli.command("reconcile_dashboard")
+@click.option('--fix', is_flag=True, help='Rebuild the counters from scratch when they drifted.')
+def reconcile_dashboard(fix):
+    """Compares the dashboard counters with a full recount."""
+    drifted = dashboard.drift()
+    for (dimension, key), (stored, actual) in sorted(drifted.items()):
+        print(f"{dimension} {key}: counter={stored} actual={actual}")
+    if not drifted:
+        print("Dashboard counters are consistent.")
+    elif fix:
+        dashboard.rebuild()
+        db.session.commit()
+        print("Dashboard counters rebuilt.")
+    else:
+        sys.exit(1)
+
+@commands_bp.cli.command("bench_login")
+@click.option('--logins', default=200, help='Logins per run.')
+@click.option('--concurrency', default=16, help='Concurrent client threads.')
+@click.option('--pool-workers', default='1,2,4', help='Comma separated hash pool sizes to compare.')
+def bench_login(logins, concurrency, pool_workers):
+    """Measures /api/login throughput against the hash pool size."""
+    app = current_app._get_current_object()
+    username, password = '__bench_login__', 'bench-password'
+    with app.app_context():
+        user = User(username=username, password=hasher.hash(password), role=UserRole.Employee,
+                    email='bench@example.com')
+        db.session.add(user)
+        db.session.commit()
+
+    client = app.test_client()
+    def attempt(_):
+        return client.post('/api/login', json={'username': username, 'password': password}).status_code
+
+    try:
+        for workers in (int(w) for w in pool_workers.split(',')):
+            hasher.configure(workers, app.config['HASH_QUEUE_DEPTH'])
+            attempt(None)  # warm the pool
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                statuses = list(pool.map(attempt, range(logins)))
+            elapsed = time.perf_counter() - start
+            ok = statuses.count(200)
+            print(f"workers={workers:<3} logins/s={ok / elapsed:8.1f} ok={ok} busy={statuses.count(503)}")
+    finally:
+        with app.app_context():
+            User.query.filter_by(username=username).delete()
+            db.session.commit()
+
+@commands_bp.cli.command("bench_serialize")
+@click.option('--rows', default=100_000, help='Synthetic asset rows to serialize.')
+def bench_serialize(rows):
+    """Compares ORM + hand-written dicts with column-only compiled serialization."""
+    def legacy_dict(asset):
+        # The pre-compiled shape: raw Enum/datetime values left to the encoder
+        return {
+            'id': asset.id, 'name': asset.name, 'description': asset.description,
+            'category_id': asset.category_id, 'status': asset.status, 'image_url': asset.image_url,
+            'allocated_to': asset.allocated_to, 'created_at': asset.created_at, 'updated_at': asset.updated_at,
+        }
+
+    # Synthetic rows live in a transaction that is rolled back at the end
+    category_id = db.session.execute(text(
+        "INSERT INTO category (category_name, created_at, updated_at) "
+        "VALUES ('__bench__', now(), now()) RETURNING id"
+    )).scalar()
+    db.session.execute(text(
+        "INSERT INTO asset (name, description, category_id, status, image_url, created_at, updated_at) "
+        "SELECT 'Asset ' || i, 'Synthetic asset ' || i, :category_id, 'Available', "
+        "'https://example.com/' || i || '.jpg', now(), now() FROM generate_series(1, :rows) AS i"
+    ), {'category_id': category_id, 'rows': rows})
+
+    def timed(label, fn):
+        db.session.expire_all()
+        start = time.perf_counter()
+        payload = fn()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<32} {elapsed * 1000:9.1f} ms  {rows / elapsed:10.0f} rows/s  {len(payload)} bytes")
+
+    legacy_json = lambda o: str(o.value) if isinstance(o, Enum) else o.isoformat()
+    only_bench = Asset.category_id == category_id
+    timed('orm + legacy dicts + json', lambda: json.dumps(
+        [legacy_dict(a) for a in Asset.query.filter(only_bench)], default=legacy_json))
+    timed('orm + compiled dump', lambda: current_app.json.dumps(
+        [a.serialize for a in Asset.query.filter(only_bench)]))
+    timed('columns + compiled dump_row', lambda: current_app.json.dumps(
+        [Asset.serializer.dump_row(r) for r in db.session.execute(Asset.serializer.select().where(only_bench))]))
+    db.session.rollback()
+
+@commands_bp.cli.command("bench_search")
+@click.option('--rows', default=1_000_000, help='Synthetic assets to search over.')
+@click.option('--queries', default=200, help='Searches to time.')
+@click.option('--keep', is_flag=True, help='Commit the synthetic rows instead of rolling back.')
+def bench_search(rows, queries, keep):
+    """Times /api/assets/search queries against a synthetic catalogue."""
+    brands = ['Dell', 'Lenovo', 'Apple', 'Samsung', 'Logitech', 'Epson', 'Canon', 'Brother',
+              'Steelcase', 'Herman Miller', 'Cisco', 'Philips', 'Asus', 'Acer', 'Sony', 'Bosch']
+    kinds = ['Laptop', 'Monitor', 'Chair', 'Desk', 'Projector', 'Printer', 'Keyboard', 'Mouse',
+             'Lamp', 'Phone', 'Router', 'Tablet', 'Webcam', 'Headset', 'Scanner', 'Cabinet']
+    words = ['ergonomic', 'wireless', 'adjustable', 'curved', 'portable', 'refurbished',
+             'compact', 'heavy duty', 'silent', 'backlit', 'mesh', 'standing']
+    rng = random.Random(42)
+    samples = []
+    for _ in range(queries):
+        brand, kind = rng.choice(brands), rng.choice(kinds)
+        samples.append(rng.choice([
+            f'{brand} {kind} {rng.randrange(2000)}',        # exact model lookup
+            f'{rng.choice(words)} {kind.lower()}',          # descriptive
+            kind[:rng.randint(3, len(kind))],               # typed prefix
+            kind[:-2] + kind[-1] + kind[-2],                # transposed typo
+        ]))
+
+    start = time.perf_counter()
+    category_id = db.session.execute(text(
+        "INSERT INTO category (category_name, created_at, updated_at) "
+        "VALUES ('__bench__', now(), now()) RETURNING id"
+    )).scalar()
+    db.session.execute(text(
+        "INSERT INTO asset (name, description, category_id, status, created_at, updated_at) "
+        "SELECT (:brands)[1 + i % :nb] || ' ' || (:kinds)[1 + (i / :nb) % :nk] || ' ' || (i % 2000), "
+        "(:words)[1 + i % :nw] || ' ' || (:words)[1 + (i / 7) % :nw] || ' unit ' || i, "
+        ":category_id, 'Available', now(), now() FROM generate_series(1, :rows) AS i"
+    ), {'brands': brands, 'kinds': kinds, 'words': words, 'nb': len(brands), 'nk': len(kinds),
+        'nw': len(words), 'category_id': category_id, 'rows': rows})
+    db.session.execute(text('ANALYZE asset'))
+    print(f"loaded {rows} assets in {time.perf_counter() - start:.1f}s")
+
+    timings = []
+    for q in samples:
+        start = time.perf_counter()
+        db.session.execute(asset_search(q).limit(21)).all()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    pct = lambda p: timings[min(len(timings) - 1, int(len(timings) * p))]
+    print(f"{queries} searches: p50={pct(0.50):.2f}ms p95={pct(0.95):.2f}ms p99={pct(0.99):.2f}ms max={timings[-1]:.2f}ms")
+
+    if keep:
+        db.session.commit()
+    else:
+        db.session.rollback()
+
+@commands_bp.cli.command("stress_allocate")
+@click.option('--assets', default=500, help='Available assets to fight over.')
+@click.option('--threads', default=32, help='Concurrent allocating clients.')
+def stress_allocate(assets, threads):
+    """Races many clients through /api/assets/allocate and checks for double allocation."""
+    app = current_app._get_current_object()
+    pool_capacity = app.config['DB_POOL_SIZE'] + app.config['DB_MAX_OVERFLOW']
+    if threads > pool_capacity:
+        print(f"note: {threads} threads share {pool_capacity} pooled connections; raise GUNICORN_THREADS to avoid pool waits")
+
+    with app.app_context():
+        category = Category(category_name='__stress__')
+        user = User(username='__stress_allocate__', password='!', role=UserRole.Employee, email='stress@example.com')
+        db.session.add_all([category, user])
+        db.session.flush()
+        db.session.execute(insert(Asset), [
+            {'name': f'Stress asset {i}', 'category_id': category.id, 'status': AssetStatus.Available}
+            for i in range(assets)
+        ])
+        db.session.commit()
+        category_id, user_id = category.id, user.id
+
+    client = app.test_client()
+    def worker(_):
+        claimed = []
+        while True:
+            response = client.post('/api/assets/allocate', json={'user_id': user_id, 'category_id': category_id})
+            if response.status_code != 200:
+                return claimed, response.status_code
+            claimed.append(response.get_json()['id'])
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            outcomes = list(pool.map(worker, range(threads)))
+        elapsed = time.perf_counter() - start
+
+        claimed = [asset_id for ids, _ in outcomes for asset_id in ids]
+        with app.app_context():
+            allocated = Asset.query.filter_by(category_id=category_id, status=AssetStatus.Allocated).count()
+        duplicates = len(claimed) - len(set(claimed))
+        print(f"{len(claimed)} allocations by {threads} threads in {elapsed:.2f}s "
+              f"({len(claimed) / elapsed:.0f}/s), duplicates={duplicates}, allocated in db={allocated}, "
+              f"final statuses={sorted({status for _, status in outcomes})}")
+        ok = duplicates == 0 and len(claimed) == assets == allocated
+    finally:
+        with app.app_context():
+            Asset.query.filter_by(category_id=category_id).delete()
+            Category.query.filter_by(id=category_id).delete()
+            User.query.filter_by(id=user_id).delete()
+            db.session.commit()
+    if not ok:
+        sys.exit(1)
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+def _rarest(column, *criteria):
+    """Least common non-null value of an asset column, the selective case its index is for."""
+    return (db.session.query(column).filter(column.isnot(None), *criteria)
+            .group_by(column).order_by(db.func.count(), column).limit(1).scalar())
+
+@commands_bp.cli.command("explain_assets")
+def explain_assets():
+    """Fails if a selective asset listing filter is not answered from its index.
+
+    Each probe must use the expected index with the filtered columns in its
+    Index Cond; walking another index and checking them as a Filter fails.
+    A status on its own is not probed: with three values it is never
+    selective enough to beat walking the primary key in id order.
+    """
+    category_id = _rarest(Asset.category_id)
+    allocated_to = _rarest(Asset.allocated_to)
+    if category_id is None or allocated_to is None:
+        print('explain_assets needs categorised and allocated assets; run flask seed first')
+        sys.exit(1)
+    status = _rarest(Asset.status, Asset.category_id == category_id)
+    cases = {
+        'status+category': ({'status': status.name, 'category_id': str(category_id)},
+                            'ix_asset_status_category_id_id', ['status', 'category_id']),
+        'category': ({'category_id': str(category_id)}, 'ix_asset_category_id_id', ['category_id']),
+        'allocated_to': ({'allocated_to': str(allocated_to)}, 'ix_asset_allocated_to', ['allocated_to']),
+    }
+    failed = False
+    # A small table is cheaper to scan than to probe; only index choices are compared
+    db.session.execute(text('SET LOCAL enable_seqscan = off'))
+    for name, (args, index, columns) in cases.items():
+        query, keys, descending = build_asset_query(args)
+        stmt = apply_keyset(query, keys, limit=100, descending=descending).statement
+        sql = str(stmt.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+        plan = db.session.execute(text('EXPLAIN (FORMAT JSON) ' + sql)).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = list(plan_nodes(plan[0]['Plan']))
+        conds = [n.get('Index Cond', '') for n in nodes if n.get('Index Name') == index]
+        ok = any(all(f'({column} =' in cond for column in columns) for cond in conds)
+        failed = failed or not ok
+        used = ', '.join(f"{n['Node Type']} on {n.get('Index Name', n.get('Relation Name'))}"
+                         + (f" filtering {n['Filter']}" if 'Filter' in n else '')
+                         for n in nodes if 'Index Name' in n or 'Relation Name' in n)
+        print(f"{'ok  ' if ok else 'FAIL'} {name} {args}: expected {index}; {used}")
+    db.session.rollback()
+    if failed:
+        sys.exit(1)
+
+# Path parameters of the checked routes, filled with the smallest existing id
+BUDGET_CHECK_IDS = {'user_id': User.id, 'category_id': Category.id, 'request_id': Request.id, 'job_id': Job.id}
+# Query strings tried on top of the bare path, for the variants that load more
+BUDGET_CHECK_VARIANTS = {
+    'routes.get_assets': ['?status=Available&sort=-updated_at', '?fields=id,name'],
+    'routes.search_assets': ['?q=laptop'],
+    'routes.get_requests': ['?include=user,asset', '?include=user,asset,history', '?fields=id,status'],
+}
+
+@commands_bp.cli.command("check_query_budgets")
+def check_query_budgets():
+    """Fails if a GET route issues more statements than its @query_budget.
+
+    Every route is requested twice, cold and with warm caches, against the
+    configured database; write routes are left out.
+    """
+    app = current_app._get_current_object()
+    ids = {name: db.session.query(db.func.min(column)).scalar() for name, column in BUDGET_CHECK_IDS.items()}
+    db.session.remove()
+    client = app.test_client()
+    failed = False
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        budget = getattr(app.view_functions[rule.endpoint], 'query_budget', None)
+        if budget is None or 'GET' not in rule.methods:
+            continue
+        if any(ids.get(name) is None for name in rule.arguments):
+            print(f"skip {rule.rule}: no rows to fill in {', '.join(sorted(rule.arguments))}")
+            continue
+        path = rule.rule
+        for name in rule.arguments:
+            path = path.replace(f'<int:{name}>', str(ids[name]))
+        for url in [path] + [path + query for query in BUDGET_CHECK_VARIANTS.get(rule.endpoint, [])]:
+            for attempt in ('cold', 'warm'):
+                try:
+                    with assert_max_queries(budget) as statements:
+                        status = client.get(url).status_code
+                except QueryBudgetExceeded as e:
+                    failed = True
+                    print(f"FAIL {url} ({attempt}): {e}")
+                    continue
+                if status >= 500:
+                    failed = True
+                    print(f"FAIL {url} ({attempt}): status {status}")
+                    continue
+                print(f"ok   {url} ({attempt}): {len(statements)}/{budget} queries, status {status}")
+    if failed:
+        sys.exit(1)
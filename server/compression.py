@@ -0,0 +1,65 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/csv'}
+
+
+class Compression:
+    """Negotiated gzip/brotli encoding for buffered responses.
+
+    Bodies under COMPRESS_MIN_SIZE go out as they are: below roughly a packet
+    the headers dominate and compressing only costs CPU. Streamed responses
+    (NDJSON exports) are left alone so they keep flushing chunk by chunk.
+    Brotli is offered only when the `brotli` package is installed.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BR_QUALITY', 4)
+        app.extensions['compression'] = self
+        if not app.config['COMPRESS_ENABLED']:
+            return
+
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        level = app.config['COMPRESS_LEVEL']
+        self.encoders = {'gzip': lambda data: gzip.compress(data, level, mtime=0)}
+        if brotli is not None:
+            quality = app.config['COMPRESS_BR_QUALITY']
+            self.encoders['br'] = lambda data: brotli.compress(data, mode=brotli.MODE_TEXT, quality=quality)
+        # Most preferred first; the client's q-values still take precedence
+        self.offers = sorted(self.encoders, key=['br', 'gzip'].index)
+        app.after_request(self._after_request)
+
+    def _after_request(self, response):
+        if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.is_streamed
+                or response.direct_passthrough or 'Content-Encoding' in response.headers):
+            return response
+        # The same URL can now answer with different encodings
+        response.vary.add('Accept-Encoding')
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+
+        encoding = request.accept_encodings.best_match(self.offers)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        response.set_data(self.encoders[encoding](data))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+compression = Compression()
@@ -0,0 +1,100 @@
+import hashlib
+from functools import wraps
+
+from flask import make_response, request
+from sqlalchemy import func, select
+
+from cache import cache
+from database import db
+from models import TableVersion
+from replicas import may_read_replica
+
+
+# Tables whose writes are NOTIFY-broadcast (migration 4e23267ffb87), so their
+# versions can come from the reference cache instead of a query
+CACHED_TABLES = {'user', 'category'}
+
+
+def versions_statement(tables):
+    return select(
+        TableVersion.table_name, func.sum(TableVersion.version), func.max(TableVersion.changed_at)
+    ).where(TableVersion.table_name.in_(tables)).group_by(TableVersion.table_name)
+
+
+def unpack_versions(rows, tables):
+    """{table: (version, changed_at)} from the rows of `versions_statement`."""
+    found = {table: (int(version), changed_at) for table, version, changed_at in rows}
+    return {table: found.get(table, (0, None)) for table in tables}
+
+
+def summarize(current):
+    """({table: version}, last modified) from `unpack_versions` output."""
+    changed = [changed_at for _, changed_at in current.values() if changed_at is not None]
+    return {table: version for table, (version, _) in current.items()}, max(changed, default=None)
+
+
+def _read_versions(tables):
+    return unpack_versions(db.session.execute(versions_statement(tables)), tables)
+
+
+def table_versions(tables):
+    """({table: version}, last modified) for `tables`, read from the counter shards.
+
+    The cache follows the primary; when the body may come from a lagging
+    replica, the versions are read there too, so they are never newer than it.
+    """
+    if CACHED_TABLES.issuperset(tables) and not may_read_replica():
+        current = {
+            table: cache.get('table_version', table, lambda table=table: _read_versions([table])[table])
+            for table in tables
+        }
+    else:
+        current = _read_versions(tables)
+    return summarize(current)
+
+
+def make_etag(full_path, versions):
+    # The full path (query string included) keeps filters, cursors and
+    # includes apart; the versions change on every committed write.
+    source = full_path + ''.join(f'|{table}={version}' for table, version in sorted(versions.items()))
+    return hashlib.sha1(source.encode()).hexdigest()[:27]
+
+
+def is_fresh(etag, if_none_match):
+    """Whether the client's cached copy is current; `if_none_match` is a werkzeug ETags set.
+
+    If-Modified-Since is never honoured. changed_at is stamped when a
+    statement runs, not when it commits, so a transaction committing after a
+    response was served can carry an older stamp than its Last-Modified.
+    The versions in the ETag change on every commit, whenever it happens.
+    """
+    return bool(if_none_match) and if_none_match.contains_weak(etag)
+
+
+def conditional(*tables):
+    """Answer GETs with a 304 when none of `tables` has changed.
+
+    The validator is one lookup on the table_version shards, so a matching
+    If-None-Match never runs the view's queries or serializer. Versions are
+    read before the view, so a write landing in between can only make the
+    ETag older than the body, which costs a refetch rather than a stale hit.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            versions, last_modified = table_versions(tables)
+            etag = make_etag(request.full_path, versions)
+            if is_fresh(etag, request.if_none_match):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Let browsers keep the body but revalidate on every poll
+            response.cache_control.no_cache = True
+            return response
+        return wrapped
+    return decorator
@@ -1,4 +1,21 @@
 import os
+import tempfile
+from dotenv import load_dotenv
+from db_pool import InstrumentedQueuePool, pool_sizing
+from logs import parse_sample_rates
+
+# Load environment variables from .env file
+load_dotenv()
+
+REQUIRED_SETTINGS = ('DATABASE_USER', 'DATABASE_PASSWORD', 'DATABASE_NAME')
+
+
+def check_required(config):
+    """Raise if `config` lacks a required setting; called by the app, not on import."""
+    missing = [name for name in REQUIRED_SETTINGS if not config.get(name)]
+    if missing:
+        raise ValueError(f"Missing required environment variables for database configuration: {', '.join(missing)}")
+
 
 class Config:
     DATABASE_USER = os.environ.get('DATABASE_USER')
@@ -6,28 +23,92 @@ class Config:
     DATABASE_HOST = os.environ.get('DATABASE_HOST', 'localhost')
     DATABASE_PORT = os.environ.get('DATABASE_PORT', '5432')       
     DATABASE_NAME = os.environ.get('DATABASE_NAME')
-
-    if not DATABASE_USER:
-        print("DATABASE_USER is not set")
-    if not DATABASE_PASSWORD:
-        print("DATABASE_PASSWORD is not set")
-    if not DATABASE_NAME:
-        print("DATABASE_NAME is not set")
-
-    if not all([DATABASE_USER, DATABASE_PASSWORD, DATABASE_NAME]):
-        raise ValueError("Missing required environment variables for database configuration.")
+    DATABASE_SSLMODE = os.environ.get('DATABASE_SSLMODE', 'require')
 
     SQLALCHEMY_DATABASE_URI = (
-        f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}?sslmode=require"
+        f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}?sslmode={DATABASE_SSLMODE}"
     )
     
+    # Streaming replicas for read-only endpoints; host:port pairs sharing the primary's credentials
+    DATABASE_REPLICA_HOSTS = [host.strip() for host in os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',') if host.strip()]
+    SQLALCHEMY_REPLICA_URIS = list(map(
+        f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{{}}/{DATABASE_NAME}?sslmode={DATABASE_SSLMODE}".format,
+        DATABASE_REPLICA_HOSTS,
+    ))
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 2))
+
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'fallback_secret_key'
+    JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your_jwt_secret_key')  # Use a strong key
+
+    # Connection pool, sized from the gunicorn worker/thread layout (see gunicorn.conf.py)
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 1))
+    DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 0))  # budget across all workers, 0 = unbounded
+    DB_POOL_SIZE, DB_MAX_OVERFLOW = pool_sizing(
+        GUNICORN_THREADS, WEB_CONCURRENCY, DB_MAX_CONNECTIONS, int(os.environ.get('DB_MAX_OVERFLOW', 2))
+    )
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,  # Drop connections that died with a Postgres restart
+        'connect_args': {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'},
+    }
+
+    # Async read path (asgi.py): asyncpg driver, one pool per ASGI worker process
+    ASYNC_DATABASE_URI = (
+        f"postgresql+asyncpg://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}?ssl={DATABASE_SSLMODE}"
+    )
+    ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 20))
+    ASYNC_DB_MAX_OVERFLOW = int(os.environ.get('ASYNC_DB_MAX_OVERFLOW', 10))
+
+    # Opt-in SQL instrumentation for development and canary; see sql_debug.py
+    SQL_DEBUG = os.environ.get('SQL_DEBUG', '').lower() in ('1', 'true', 'yes')
+    SQL_SLOW_QUERY_MS = int(os.environ.get('SQL_SLOW_QUERY_MS', 200))
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+    SQL_QUERY_BUDGET_STRICT = os.environ.get('SQL_QUERY_BUDGET_STRICT', '').lower() in ('1', 'true', 'yes')
+
+    # Password hashing runs in a bounded process pool; see hashing.py
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    HASH_POOL_WORKERS = int(os.environ.get('HASH_POOL_WORKERS', 2))
+    # Slots beyond this fail with a 503; by default hashing may occupy at most
+    # half of the request threads, leaving the rest for other endpoints
+    HASH_QUEUE_DEPTH = int(os.environ.get('HASH_QUEUE_DEPTH', max(0, GUNICORN_THREADS // 2 - HASH_POOL_WORKERS)))
+    HASH_TIMEOUT = float(os.environ.get('HASH_TIMEOUT', 2))
+
+    # Per-worker reference cache, invalidated over LISTEN/NOTIFY; see cache.py
+    CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+    CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+
+    # Negotiated gzip/brotli for buffered responses; see compression.py
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_BR_QUALITY = int(os.environ.get('COMPRESS_BR_QUALITY', 4))
+
+    # Background jobs run by `flask worker`; see jobs.py
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 5))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_BACKOFF_SECONDS = float(os.environ.get('JOB_BACKOFF_SECONDS', 10))
+    JOB_BACKOFF_MAX_SECONDS = float(os.environ.get('JOB_BACKOFF_MAX_SECONDS', 3600))
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+    # Exports and spooled imports; must be shared by the web and worker hosts
+    JOB_FILES_DIR = os.environ.get('JOB_FILES_DIR', os.path.join(tempfile.gettempdir(), 'asset-jobs'))
 
-# For debugging: print the environment variable values
-print("DATABASE_USER:", Config.DATABASE_USER)
-print("DATABASE_PASSWORD:", Config.DATABASE_PASSWORD)
-print("DATABASE_HOST:", Config.DATABASE_HOST)
-print("DATABASE_PORT:", Config.DATABASE_PORT)
-print("DATABASE_NAME:", Config.DATABASE_NAME)
-print("SECRET_KEY:", Config.SECRET_KEY)
\ No newline at end of file
+    # JSON logs written by a background thread; see logs.py
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # or 'text' for local development
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    # Share of the records below WARNING kept per logger; errors and slow requests are always logged
+    LOG_SAMPLE_RATES = parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES', 'access=0.1'))
+    LOG_SLOW_REQUEST_MS = int(os.environ.get('LOG_SLOW_REQUEST_MS', 1000))
@@ -0,0 +1,78 @@
+from sqlalchemy import func, text
+
+from database import db
+from models import (
+    Asset, AssetStatus, DashboardCounter, Request, RequestStatus, UrgencyLevel,
+)
+
+# dimension -> column it counts; must match the triggers in migration 2fd29c305b4d
+DIMENSIONS = {
+    'asset_status': Asset.status,
+    'asset_category': Asset.category_id,
+    'request_status': Request.status,
+    'request_urgency': Request.urgency,
+}
+
+
+def _key(value):
+    return value.value if hasattr(value, 'value') else str(value)
+
+
+def counter_totals():
+    """{(dimension, key): count} summed over the counter shards."""
+    rows = db.session.query(
+        DashboardCounter.dimension, DashboardCounter.key, func.sum(DashboardCounter.count)
+    ).group_by(DashboardCounter.dimension, DashboardCounter.key)
+    return {(dimension, key): int(count) for dimension, key, count in rows if count}
+
+
+def actual_counts():
+    """The same numbers computed from scratch with GROUP BY."""
+    counts = {}
+    for dimension, column in DIMENSIONS.items():
+        for value, count in db.session.query(column, func.count()).group_by(column):
+            counts[(dimension, _key(value))] = count
+    return counts
+
+
+def drift():
+    """{(dimension, key): (counter, actual)} for every counter that is off."""
+    stored, actual = counter_totals(), actual_counts()
+    return {
+        key: (stored.get(key, 0), actual.get(key, 0))
+        for key in stored.keys() | actual.keys()
+        if stored.get(key, 0) != actual.get(key, 0)
+    }
+
+
+def rebuild():
+    """Recompute every counter. Blocks asset/request writes until the caller commits."""
+    db.session.execute(text('LOCK TABLE asset, request IN SHARE MODE'))
+    db.session.query(DashboardCounter).delete()
+    db.session.add_all(
+        DashboardCounter(dimension=dimension, key=key, shard=0, count=count)
+        for (dimension, key), count in actual_counts().items()
+    )
+
+
+def summary(categories):
+    """Counter totals, with a row per category in `categories` (serialized, id order)."""
+    totals = counter_totals()
+
+    def by(dimension, keys):
+        return {key: totals.get((dimension, key), 0) for key in keys}
+
+    return {
+        'assets': {
+            'by_status': by('asset_status', [s.value for s in AssetStatus]),
+            'by_category': [
+                {'category_id': category['id'], 'category_name': category['category_name'],
+                 'count': totals.get(('asset_category', str(category['id'])), 0)}
+                for category in categories
+            ],
+        },
+        'requests': {
+            'by_status': by('request_status', [s.value for s in RequestStatus]),
+            'by_urgency': by('request_urgency', [u.value for u in UrgencyLevel]),
+        },
+    }
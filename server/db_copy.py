@@ -0,0 +1,26 @@
+"""COPY helpers shared by the data generator and the bulk asset import."""
+import io
+from datetime import datetime
+from enum import Enum
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return str(value)
+
+
+def copy_rows(cursor, table, columns, rows):
+    """COPY an iterable of tuples into `table` as one statement."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(map(_copy_value, row)))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f'COPY "{table}" ({", ".join(columns)}) FROM STDIN', buffer)
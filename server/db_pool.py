@@ -0,0 +1,109 @@
+import bisect
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def pool_sizing(threads, workers=1, max_connections=0, max_overflow=2):
+    """Work out (pool_size, max_overflow) for one web worker process.
+
+    Every request thread may hold one connection, so the steady pool matches
+    the thread count. When `max_connections` is set it is treated as the
+    budget for the whole deployment and split evenly across worker processes.
+    """
+    pool_size = max(1, threads)
+    if max_connections:
+        per_worker = max(1, max_connections // max(1, workers))
+        pool_size = min(pool_size, per_worker)
+        max_overflow = per_worker - pool_size
+    return pool_size, max_overflow
+
+
+class CheckoutStats:
+    """Per-process record of how long request threads waited for a connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self.reset()
+
+    def subscribe(self, callback):
+        """Call `callback(seconds, timed_out)` for every recorded checkout."""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+            self.timeouts = 0
+            self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.timeouts += timed_out
+            self.buckets[bisect.bisect_left(WAIT_BUCKETS, seconds)] += 1
+        for callback in self._subscribers:
+            callback(seconds, timed_out)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'total_seconds': self.total,
+                'max_seconds': self.max,
+                'timeouts': self.timeouts,
+                'buckets': dict(zip([*map(str, WAIT_BUCKETS), '+Inf'], self.buckets)),
+            }
+
+
+checkout_stats = CheckoutStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waits for a free connection."""
+
+    stats = checkout_stats
+
+    @classmethod
+    def labelled(cls):
+        """Subclass recording into CheckoutStats of its own, for another database.
+
+        A class rather than an instance attribute, because dispose() rebuilds
+        the pool from its class.
+        """
+        return type(cls.__name__, (cls,), {'stats': CheckoutStats()})
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            timed_out = True
+            raise
+        finally:
+            self.stats.record(time.perf_counter() - start, timed_out)
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'wait': getattr(pool, 'stats', checkout_stats).snapshot()}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            # Negative while the steady pool has not been filled yet
+            'overflow': max(0, pool.overflow()),
+        })
+    return stats
@@ -0,0 +1,36 @@
+import os
+
+# Keep these in sync with the pool sizing in config.py, which reads the same variables
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+wsgi_app = 'wsgi:app'
+# Import and build the app once in the master; workers fork with it ready
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+
+# Prometheus multiprocess mode: every worker writes its metrics to files in
+# PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them.
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    # Pooled connections opened in the master must not be shared with it
+    if server.cfg.preload_app:
+        from wsgi import app
+        with app.app_context():
+            for engine in app.extensions['sqlalchemy'].engines.values():
+                engine.dispose(close=False)
+        for replica in app.extensions['replicas'].replicas:
+            replica.engine.dispose(close=False)
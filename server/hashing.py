@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import threading
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashPoolBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+
+def _parse_method(method):
+    """(algorithm, parameters) of a werkzeug hash method, with its defaults filled in.
+
+    werkzeug stores e.g. ``scrypt`` as ``scrypt:32768:8:1``, so configured
+    and stored methods only compare equal once both are normalised.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return name, tuple(map(int, args)) if args else (2 ** 15, 8, 1)
+    if name == 'pbkdf2' and len(args) <= 2:
+        hash_name = args[0] if args else 'sha256'
+        return name, (hash_name, int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS)
+    raise ValueError(f'Unsupported password hash method: {method}')
+
+
+def _generate(password, method, salt_length):
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def _check(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+class PasswordHasher:
+    """Runs the password KDF in a bounded process pool off the request thread.
+
+    At most ``HASH_POOL_WORKERS + HASH_QUEUE_DEPTH`` hashes are in flight per
+    web worker; anything beyond that fails fast with `HashPoolBusy` instead of
+    queueing behind a login storm. A hash holds its slot until it has finished
+    or been cancelled, even when the request waiting for it timed out.
+
+    Only request threads can fill the slots, so the bound is reachable only
+    with more GUNICORN_THREADS than slots; config.py derives the default
+    queue depth from the thread count so that hashing can hold at most half
+    of them.
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        app.config.setdefault('PASSWORD_SALT_LENGTH', 16)
+        app.config.setdefault('HASH_POOL_WORKERS', 2)
+        app.config.setdefault('HASH_QUEUE_DEPTH', 16)
+        app.config.setdefault('HASH_TIMEOUT', 2)
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self._parsed_method = _parse_method(self.method)
+        self.salt_length = int(app.config['PASSWORD_SALT_LENGTH'])
+        self.configure(int(app.config['HASH_POOL_WORKERS']), int(app.config['HASH_QUEUE_DEPTH']))
+        self.timeout = float(app.config['HASH_TIMEOUT'])
+        app.extensions['password_hasher'] = self
+
+    def configure(self, workers, queue_depth):
+        """(Re)size the pool; the executor itself is created on first use."""
+        self.shutdown()
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _get_executor(self):
+        # Gunicorn forks workers after import, so every process builds its own pool.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('forkserver'),
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashPoolBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset()
+            raise HashPoolBusy()
+        except BaseException:
+            self._slots.release()
+            raise
+        # Released when the hash is done, not when this request gives up on it
+        slots = self._slots
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except futures.TimeoutError:
+            # futures.TimeoutError is only the builtin one from Python 3.11 on.
+            # Drops the hash if still queued; a running one keeps its slot until it ends
+            future.cancel()
+            raise HashPoolBusy()
+        except BrokenProcessPool:
+            self._reset()
+            raise HashPoolBusy()
+
+    def _reset(self):
+        # A pool process died (e.g. OOM killed); rebuild the pool on the next call
+        with self._lock:
+            self._executor = None
+
+    def hash(self, password):
+        return self._run(_generate, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(_check, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True when the stored hash was made with other parameters than the current ones."""
+        try:
+            method, salt, _ = pwhash.split('$', 2)
+            return _parse_method(method) != self._parsed_method or len(salt) != self.salt_length
+        except ValueError:
+            return True
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,278 @@
+"""Durable background jobs on the existing Postgres.
+
+    job = jobs.enqueue('assets.export', {'format': 'csv'})
+    db.session.commit()  # the job becomes visible, and wakes a worker, on commit
+
+Handlers are registered with @handler(kind), take the claimed job (id, kind,
+payload, attempts, max_attempts) and return a JSON-serializable result.
+They do not commit: their writes are committed in one transaction with the
+job's success, so a job never runs again after its work was saved. Work
+outside the database that must only happen then, such as removing an input
+file, is registered with on_commit().
+`flask worker` forks JOB_WORKERS processes. Each one claims one due job at a
+time with FOR UPDATE SKIP LOCKED, so any number of workers, on any number of
+hosts, share the queue without handing out a job twice.
+
+A job that raises is retried with exponential backoff until it has run
+max_attempts times; raise JobFailed to give up straight away. A running job
+holds a lease that its worker renews every JOB_LEASE_SECONDS / 3. If the
+worker dies, the lease expires and the job goes back to the queue.
+"""
+import logging
+import multiprocessing
+import os
+import random
+import select
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import func, select as sql_select, update
+
+from database import db
+from models import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+# Must match the trigger in migration 7c1e5a9b3d20
+CHANNEL = 'job_enqueued'
+
+HANDLERS = {}
+
+# Callbacks of the job running in this process; see on_commit()
+_on_commit = []
+
+
+class JobFailed(Exception):
+    """Raised by a handler to fail its job without further retries."""
+
+
+def handler(kind):
+    """Register the decorated function as the handler for jobs of `kind`."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def on_commit(fn):
+    """Call `fn` once the running job has succeeded and its writes are committed.
+
+    Dropped when the job fails or its worker lost the lease, since the job
+    then runs again.
+    """
+    _on_commit.append(fn)
+
+
+def enqueue(kind, payload=None, max_attempts=None, delay=0):
+    """Add a job to the current session and return it, flushed so it has an id.
+
+    Nothing runs until the caller commits, so a job can be enqueued in the
+    same transaction as the write it follows up on.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(kind=kind, payload=payload or {}, status=JobStatus.Queued,
+              max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'])
+    if delay:
+        job.run_at = func.now() + timedelta(seconds=delay)
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+def backoff(attempts, base, cap):
+    """Seconds to wait before retry number `attempts`: doubling, capped, jittered."""
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+
+
+def claim_statement(worker):
+    """Claim the next due job for `worker`, or return no row."""
+    due = (
+        sql_select(Job.id)
+        .where(Job.status == JobStatus.Queued, Job.run_at <= func.now())
+        .order_by(Job.run_at, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    return (
+        update(Job)
+        .where(Job.id == due)
+        .values(status=JobStatus.Running, attempts=Job.attempts + 1, locked_by=worker,
+                locked_at=func.now(), updated_at=func.now())
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+    )
+
+
+class Worker:
+    """Runs jobs one at a time in the current process until `stop` is set."""
+
+    def __init__(self, config, stop):
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stop = stop
+        self.poll_interval = config['JOB_POLL_INTERVAL']
+        self.lease = config['JOB_LEASE_SECONDS']
+        self.backoff_base = config['JOB_BACKOFF_SECONDS']
+        self.backoff_cap = config['JOB_BACKOFF_MAX_SECONDS']
+        self.engine = db.engine
+        self.listener = None
+
+    def run(self):
+        logger.info('Job worker %s started', self.name)
+        while not self.stop.is_set():
+            job = db.session.execute(claim_statement(self.name)).first()
+            db.session.commit()
+            if job is not None:
+                self.execute(job)
+                continue
+            expired = self._expire_leases()
+            if expired:
+                logger.warning('Released %d jobs whose lease expired', expired)
+            else:
+                self.wait()
+        if self.listener is not None:
+            self.listener.close()
+        logger.info('Job worker %s stopped', self.name)
+
+    def execute(self, job):
+        renewing = threading.Event()
+        threading.Thread(target=self._renew_lease, args=(job.id, renewing), name='job-lease', daemon=True).start()
+        started = time.perf_counter()
+        _on_commit.clear()
+        try:
+            fn = HANDLERS.get(job.kind)
+            if fn is None:
+                raise JobFailed(f'No handler for job kind {job.kind}')
+            result = fn(job)
+            # In the handler's transaction: its writes and the success commit
+            # together, or neither does
+            if not self._finish(job, status=JobStatus.Succeeded, result=result, error=None,
+                                finished_at=func.now()):
+                db.session.rollback()
+                logger.warning('Job %d (%s) lost its lease; its work was rolled back', job.id, job.kind)
+                return
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            error = f'{type(e).__name__}: {e}'
+            if isinstance(e, JobFailed) or job.attempts >= job.max_attempts:
+                logger.exception('Job %d (%s) failed for good', job.id, job.kind)
+                self._finish(job, status=JobStatus.Failed, error=error, finished_at=func.now())
+            else:
+                delay = backoff(job.attempts, self.backoff_base, self.backoff_cap)
+                logger.warning('Job %d (%s) failed, retrying in %.0fs: %s', job.id, job.kind, delay, error)
+                self._finish(job, status=JobStatus.Queued, error=error,
+                             run_at=func.now() + timedelta(seconds=delay))
+            db.session.commit()
+        else:
+            logger.info('Job %d (%s) done in %.1fs', job.id, job.kind, time.perf_counter() - started)
+            for callback in _on_commit:
+                try:
+                    callback()
+                except Exception:
+                    logger.exception('on_commit callback of job %d (%s) failed', job.id, job.kind)
+        finally:
+            _on_commit.clear()
+            renewing.set()
+
+    def _expire_leases(self):
+        # Jobs whose worker stopped renewing the lease go back to the queue,
+        # unless that was their last attempt
+        expired = (Job.status == JobStatus.Running, Job.locked_at < func.now() - timedelta(seconds=self.lease))
+        values = dict(error='Worker stopped renewing its lease', locked_by=None, locked_at=None, updated_at=func.now())
+        count = db.session.execute(update(Job).where(*expired, Job.attempts >= Job.max_attempts)
+                                   .values(status=JobStatus.Failed, finished_at=func.now(), **values)).rowcount
+        count += db.session.execute(update(Job).where(*expired, Job.attempts < Job.max_attempts)
+                                    .values(status=JobStatus.Queued, **values)).rowcount
+        db.session.commit()
+        return count
+
+    def _finish(self, job, **values):
+        """Record how `job` ended, in the current transaction; False if it is no longer ours."""
+        # A job whose lease expired may already belong to another worker
+        return db.session.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.locked_by == self.name, Job.status == JobStatus.Running)
+            .values(locked_by=None, locked_at=None, updated_at=func.now(), **values)
+        ).rowcount == 1
+
+    def _renew_lease(self, job_id, done):
+        while not done.wait(self.lease / 3):
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(update(Job).where(Job.id == job_id, Job.locked_by == self.name)
+                                 .values(locked_at=func.now()))
+            except Exception:
+                logger.exception('Could not renew the lease on job %d', job_id)
+
+    def wait(self):
+        """Sleep until a job is enqueued or JOB_POLL_INTERVAL passes.
+
+        Retries coming due are only noticed by the poll, and so is
+        everything while the LISTEN connection is down.
+        """
+        try:
+            if self.listener is None:
+                raw = self.engine.raw_connection()
+                conn = raw.driver_connection
+                raw.detach()
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                self.listener = conn
+            if select.select([self.listener], [], [], self.poll_interval) != ([], [], []):
+                self.listener.poll()
+                self.listener.notifies.clear()
+        except Exception:
+            logger.exception('Job listener lost its connection; polling instead')
+            if self.listener is not None and not self.listener.closed:
+                self.listener.close()
+            self.listener = None
+            self.stop.wait(self.poll_interval)
+
+
+def _work(app):
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    with app.app_context():
+        # Sockets inherited from the supervisor belong to it
+        db.engine.dispose(close=False)
+        try:
+            Worker(app.config, stop).run()
+        finally:
+            # Forked children skip atexit, which would write out queued log records
+            logging.shutdown()
+
+
+def run_workers(app, processes):
+    """Fork `processes` workers and keep them running until SIGTERM or SIGINT.
+
+    Workers finish the job in hand before exiting; dead ones are replaced.
+    """
+    context = multiprocessing.get_context('fork')
+    with app.app_context():
+        db.engine.dispose()
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+
+    def spawn():
+        process = context.Process(target=_work, args=(app,), name='job-worker')
+        process.start()
+        return process
+
+    workers = [spawn() for _ in range(processes)]
+    while not stopping.wait(1):
+        for index, process in enumerate(workers):
+            if not process.is_alive():
+                logger.warning('Job worker %d exited with %s; restarting it', process.pid, process.exitcode)
+                workers[index] = spawn()
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join()
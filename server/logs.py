@@ -0,0 +1,277 @@
+"""Structured JSON logging that never blocks a request thread.
+
+Every record goes to one bounded in-memory queue; a listener thread per
+process formats it and writes it to stderr. A request thread only resolves
+the message and appends it to the queue. When the listener falls behind
+and the queue is full, records are dropped and counted in
+log_records_dropped_total.
+
+    logger.info('Asset allocated', extra={'asset_id': asset.id, 'user_id': user.id})
+
+becomes one JSON object per line, with the `extra` fields next to
+ts/level/logger/message, and request_id while handling a request. The id
+comes from a well-formed X-Request-ID header, or is generated, and is
+returned in the X-Request-ID response header so that clients and proxies
+can quote it.
+
+Fields whose name looks like a secret (password, token, authorization,
+...) are replaced with [REDACTED] at any depth, and so are `password=...`
+style pairs inside messages. Records below WARNING from the loggers in
+LOG_SAMPLE_RATES are kept at the given rate. The per-request `access` log
+is sampled this way, while errors and slow requests are logged as warnings
+and always kept.
+"""
+import copy
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+from prometheus_client import Counter
+
+from serializers import to_json
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Client-supplied ids end up in every log line; anything else is replaced
+REQUEST_ID = re.compile(r'[\w.:-]{1,128}')
+
+REDACTED = '[REDACTED]'
+SECRET_KEY = re.compile(r'pass(word|wd)?|secret|token|authorization|cookie|api[_-]?key|credential', re.I)
+SECRET_TEXT = re.compile(
+    r'''((?:password|passwd|secret|token|api[_-]?key|authorization)[\w-]*['"]?\s*[:=]\s*)'''
+    r'''(?:bearer\s+)?("[^"]*"|'[^']*'|[^\s,;&}]+)''',
+    re.I,
+)
+
+ACCESS_LOG = logging.getLogger('access')
+
+LOG_DROPPED = Counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+# LogRecord attributes; everything else on a record came in through `extra`
+STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+
+
+def parse_sample_rates(value):
+    """{'access': 0.1} from 'access=0.1', as found in LOG_SAMPLE_RATES."""
+    rates = {}
+    for item in value.split(','):
+        name, _, rate = item.partition('=')
+        if name.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def redact(value):
+    """`value` with the values of secret-looking keys replaced, at any depth."""
+    if isinstance(value, dict):
+        return {key: REDACTED if isinstance(key, str) and SECRET_KEY.search(key) else redact(item)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [redact(item) for item in value]
+    return value
+
+
+def redact_text(text):
+    return SECRET_TEXT.sub(rf'\1{REDACTED}', text)
+
+
+class JSONFormatter(logging.Formatter):
+    """One compact JSON object per record."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': redact_text(record.getMessage()),
+            'pid': record.process,
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        extra = redact({key: value for key, value in vars(record).items()
+                        if key not in STANDARD_ATTRS and key not in entry})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = redact_text(record.exc_text)
+        try:
+            return to_json({**entry, **extra}).decode()
+        except TypeError:
+            extra = {key: value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+                     for key, value in extra.items()}
+            return to_json({**entry, **extra}).decode()
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for development, redacted the same way."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        record.request_id = getattr(record, 'request_id', None) or '-'
+        return redact_text(super().format(record))
+
+
+class RequestContext(logging.Filter):
+    """Tags records with the id of the request being handled, in the logging thread."""
+
+    def filter(self, record):
+        record.request_id = g.get('request_id') if has_request_context() else None
+        return True
+
+
+class Sampler(logging.Filter):
+    """Keeps a random share of the records below WARNING from the loggers in `rates`.
+
+    A rate applies to its logger and the loggers below it; kept records carry
+    `sample_rate` so that counts can be scaled back up.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._resolved = {}
+
+    def _rate(self, name):
+        if name not in self._resolved:
+            rate, parts = None, name.split('.')
+            for end in range(len(parts), 0, -1):
+                rate = self.rates.get('.'.join(parts[:end]))
+                if rate is not None:
+                    break
+            self._resolved[name] = rate
+        return self._resolved[name]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate is None:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class NonBlockingHandler(QueueHandler):
+    """Queues records for a listener thread that hands them to `target`.
+
+    The listener is started lazily in each process: threads do not survive a
+    gunicorn fork, and a queue inherited mid-operation could be left locked.
+    """
+
+    def __init__(self, target, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.target = target
+        self.maxsize = maxsize
+        self.listener = None
+        self._pid = None
+
+    def prepare(self, record):
+        # Resolved now: the arguments may be mutated once this thread moves on
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = self.target.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # Called with the handler lock held, which logging re-creates after a fork
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self.queue = queue.Queue(self.maxsize)
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def close(self):
+        # logging.shutdown() at exit: write out whatever is still queued
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+        self.target.close()
+        super().close()
+
+
+class StructuredLogging:
+    """Routes all logging through a NonBlockingHandler and adds request ids and an access log."""
+
+    def __init__(self, app=None):
+        self.handler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOG_LEVEL', 'INFO')
+        app.config.setdefault('LOG_FORMAT', 'json')
+        app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('LOG_SAMPLE_RATES', {'access': 0.1})
+        app.config.setdefault('LOG_SLOW_REQUEST_MS', 1000)
+        app.extensions['structured_logging'] = self
+
+        target = logging.StreamHandler(sys.stderr)
+        target.setFormatter(JSONFormatter() if app.config['LOG_FORMAT'] == 'json' else TextFormatter())
+        handler = NonBlockingHandler(target, app.config['LOG_QUEUE_SIZE'])
+        handler.addFilter(Sampler(app.config['LOG_SAMPLE_RATES']))
+        handler.addFilter(RequestContext())
+
+        root = logging.getLogger()
+        if self.handler is not None:
+            root.removeHandler(self.handler)
+            self.handler.close()
+        root.addHandler(handler)
+        root.setLevel(app.config['LOG_LEVEL'])
+        # Alembic announces its plugins at INFO on import; `flask db` turns its
+        # logs back on through alembic.ini
+        logging.getLogger('alembic').setLevel(logging.WARNING)
+        app.logger.removeHandler(default_handler)
+        self.handler = handler
+        self.slow_seconds = app.config['LOG_SLOW_REQUEST_MS'] / 1000
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        g.log_start = time.perf_counter()
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = incoming if REQUEST_ID.fullmatch(incoming) else uuid.uuid4().hex
+
+    def _after_request(self, response):
+        if 'request_id' not in g:
+            return response
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        if request.endpoint == 'metrics':
+            return response
+        elapsed = time.perf_counter() - g.log_start
+        slow = elapsed >= self.slow_seconds
+        level = logging.WARNING if response.status_code >= 500 or slow else logging.INFO
+        if ACCESS_LOG.isEnabledFor(level):
+            ACCESS_LOG.log(level, '%s %s %d', request.method, request.path, response.status_code, extra={
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.url_rule.rule if request.url_rule else None,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 2),
+                'db_queries': g.get('db_queries'),
+                'bytes': response.content_length,
+                'slow': slow,
+            })
+        return response
+
+
+structured_logging = StructuredLogging()
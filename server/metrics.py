@@ -0,0 +1,124 @@
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from db_pool import WAIT_BUCKETS, checkout_stats, pool_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint',
+    ['method', 'endpoint'], buckets=LATENCY_BUCKETS,
+)
+REQUEST_COUNT = Counter(
+    'http_requests_total', 'Requests by endpoint and status', ['method', 'endpoint', 'status'],
+)
+DB_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements issued per request',
+    ['endpoint'], buckets=QUERY_COUNT_BUCKETS,
+)
+DB_TIME = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL per request',
+    ['endpoint'], buckets=LATENCY_BUCKETS,
+)
+POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Connections in use', multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('db_pool_overflow', 'Connections open beyond pool_size', multiprocess_mode='livesum')
+POOL_SIZE = Gauge('db_pool_size', 'Configured steady pool size', multiprocess_mode='livesum')
+POOL_WAIT = Histogram('db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection',
+                      buckets=WAIT_BUCKETS)
+POOL_TIMEOUTS = Counter('db_pool_checkout_timeouts_total', 'Checkouts that gave up waiting')
+
+
+def _record_checkout(seconds, timed_out):
+    POOL_WAIT.observe(seconds)
+    if timed_out:
+        POOL_TIMEOUTS.inc()
+
+
+def _endpoint():
+    # The URL rule, not the raw path, keeps label cardinality bounded
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    starts = context.connection.info.get('query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def registry():
+    """Registry to scrape: aggregates every gunicorn worker in multiprocess mode."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        collector = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collector)
+        return collector
+    return REGISTRY
+
+
+class Metrics:
+    """Per-route latency/status metrics and per-request SQL counters.
+
+    Set PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py) so that every worker
+    writes to shared files and /metrics reports totals for the whole server.
+    """
+
+    def __init__(self, app=None, db=None):
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        checkout_stats.subscribe(_record_checkout)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        app.extensions['metrics'] = self
+
+    def _before_request(self):
+        g.request_start = time.perf_counter()
+        g.db_queries = 0
+        g.db_time = 0.0
+
+    def _after_request(self, response):
+        if 'request_start' not in g or request.endpoint == 'metrics':
+            return response
+        endpoint = _endpoint()
+        REQUEST_LATENCY.labels(request.method, endpoint).observe(time.perf_counter() - g.request_start)
+        REQUEST_COUNT.labels(request.method, endpoint, response.status_code).inc()
+        DB_QUERIES.labels(endpoint).observe(g.db_queries)
+        DB_TIME.labels(endpoint).observe(g.db_time)
+
+        stats = pool_stats(self.db.engine)
+        if 'size' in stats:
+            POOL_SIZE.set(stats['size'])
+            POOL_CHECKED_OUT.set(stats['checked_out'])
+            POOL_OVERFLOW.set(stats['overflow'])
+        return response
+
+    def export(self):
+        return Response(generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+metrics = Metrics()
@@ -100,6 +100,9 @@ def run_migrations_online():
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
+            # Autocommit blocks (online_migrations.py) then only commit
+            # the migration they are in
+            transaction_per_migration=True,
             **conf_args
         )
 
@@ -0,0 +1,99 @@
+"""Add trigger-maintained dashboard counters for assets and requests
+
+Revision ID: 2fd29c305b4d
+Revises: f77ce6f492ae
+Create Date: 2026-10-18 08:46:30.208574
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2fd29c305b4d'
+down_revision = 'f77ce6f492ae'
+branch_labels = None
+depends_on = None
+
+SHARDS = 8
+
+# table -> (dimension, column) pairs counted for it
+DIMENSIONS = {
+    'asset': [('asset_status', 'status'), ('asset_category', 'category_id')],
+    'request': [('request_status', 'status'), ('request_urgency', 'urgency')],
+}
+
+
+def _deltas(dimensions, rows, sign):
+    return ' UNION ALL '.join(
+        f"SELECT '{dimension}' AS dimension, {column}::text AS key, {sign} AS delta FROM {rows}"
+        for dimension, column in dimensions
+    )
+
+
+def _apply(deltas):
+    # Rows are written in a fixed order so concurrent statements cannot deadlock
+    return f"""
+        INSERT INTO dashboard_counter (dimension, key, shard, count)
+        SELECT dimension, key, pg_backend_pid() % {SHARDS}, sum(delta)
+        FROM ({deltas}) AS deltas
+        GROUP BY dimension, key
+        HAVING sum(delta) <> 0
+        ORDER BY dimension, key
+        ON CONFLICT (dimension, key, shard)
+        DO UPDATE SET count = dashboard_counter.count + EXCLUDED.count;
+    """
+
+
+def upgrade():
+    op.create_table('dashboard_counter',
+        sa.Column('dimension', sa.String(length=32), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('shard', sa.SmallInteger(), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('dimension', 'key', 'shard')
+    )
+
+    for table, dimensions in DIMENSIONS.items():
+        inserted = _apply(_deltas(dimensions, 'new_rows', 1))
+        deleted = _apply(_deltas(dimensions, 'old_rows', -1))
+        updated = _apply(_deltas(dimensions, 'new_rows', 1) + ' UNION ALL ' + _deltas(dimensions, 'old_rows', -1))
+        op.execute(f"""
+            CREATE FUNCTION dashboard_count_{table}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN {inserted}
+                ELSIF TG_OP = 'DELETE' THEN {deleted}
+                ELSE {updated}
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        # Transition tables need one trigger per event; each fires once per statement
+        op.execute(f"""
+            CREATE TRIGGER dashboard_count_{table}_insert AFTER INSERT ON "{table}"
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION dashboard_count_{table}();
+            CREATE TRIGGER dashboard_count_{table}_update AFTER UPDATE ON "{table}"
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION dashboard_count_{table}();
+            CREATE TRIGGER dashboard_count_{table}_delete AFTER DELETE ON "{table}"
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION dashboard_count_{table}();
+        """)
+
+        # Backfill from the current rows
+        op.execute(f"""
+            INSERT INTO dashboard_counter (dimension, key, shard, count)
+            SELECT dimension, key, 0, sum(delta)
+            FROM ({_deltas(dimensions, f'"{table}"', 1)}) AS deltas
+            GROUP BY dimension, key
+        """)
+
+
+def downgrade():
+    for table in DIMENSIONS:
+        for event in ('insert', 'update', 'delete'):
+            op.execute(f'DROP TRIGGER IF EXISTS dashboard_count_{table}_{event} ON "{table}"')
+        op.execute(f'DROP FUNCTION IF EXISTS dashboard_count_{table}()')
+    op.drop_table('dashboard_counter')
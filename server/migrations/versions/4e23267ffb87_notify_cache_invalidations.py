@@ -0,0 +1,56 @@
+"""NOTIFY reference cache invalidations on user and category writes
+
+Revision ID: 4e23267ffb87
+Revises: fefcf3beedf7
+Create Date: 2026-10-18 08:55:24.484147
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4e23267ffb87'
+down_revision = 'fefcf3beedf7'
+branch_labels = None
+depends_on = None
+
+# Must match cache.CHANNEL
+CHANNEL = 'cache_invalidate'
+
+TABLES = ['user', 'category']
+
+
+def upgrade():
+    # Payload is "table:id", or just "table" when the whole table went away.
+    # Postgres delivers NOTIFY on commit and folds duplicate payloads.
+    op.execute(f"""
+        CREATE FUNCTION cache_invalidate() RETURNS trigger AS $$
+        BEGIN
+            IF TG_LEVEL = 'STATEMENT' THEN
+                PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME);
+            ELSIF TG_OP = 'INSERT' THEN
+                PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME || ':' || NEW.id);
+            ELSE
+                PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME || ':' || OLD.id);
+                IF TG_OP = 'UPDATE' AND NEW.id <> OLD.id THEN
+                    PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME || ':' || NEW.id);
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in TABLES:
+        op.execute(f"""
+            CREATE TRIGGER cache_invalidate_{table} AFTER INSERT OR UPDATE OR DELETE ON "{table}"
+            FOR EACH ROW EXECUTE FUNCTION cache_invalidate();
+            CREATE TRIGGER cache_invalidate_{table}_truncate AFTER TRUNCATE ON "{table}"
+            FOR EACH STATEMENT EXECUTE FUNCTION cache_invalidate();
+        """)
+
+
+def downgrade():
+    for table in TABLES:
+        op.execute(f'DROP TRIGGER cache_invalidate_{table}_truncate ON "{table}"')
+        op.execute(f'DROP TRIGGER cache_invalidate_{table} ON "{table}"')
+    op.execute('DROP FUNCTION cache_invalidate()')
@@ -0,0 +1,67 @@
+"""Add the background job queue
+
+Revision ID: 7c1e5a9b3d20
+Revises: 4e23267ffb87
+Create Date: 2026-10-18 09:32:10.512873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e5a9b3d20'
+down_revision = '4e23267ffb87'
+branch_labels = None
+depends_on = None
+
+# Must match jobs.CHANNEL
+CHANNEL = 'job_enqueued'
+
+
+def upgrade():
+    job_status = postgresql.ENUM('Queued', 'Running', 'Succeeded', 'Failed', name='jobstatus')
+    op.create_table('job',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('kind', sa.String(length=64), nullable=False),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('status', job_status, nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('locked_by', sa.String(length=255), nullable=True),
+        sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_job_queued_run_at', 'job', ['run_at', 'id'], postgresql_where=sa.text("status = 'Queued'"))
+    op.create_index('ix_job_running_locked_at', 'job', ['locked_at'], postgresql_where=sa.text("status = 'Running'"))
+    op.create_index('ix_job_kind_id', 'job', ['kind', 'id'])
+
+    # One wake-up per enqueueing statement, delivered when it commits
+    op.execute(f"""
+        CREATE FUNCTION job_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{CHANNEL}', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER job_notify AFTER INSERT ON job
+        FOR EACH STATEMENT EXECUTE FUNCTION job_notify();
+    """)
+
+
+def downgrade():
+    op.execute('DROP TRIGGER job_notify ON job')
+    op.execute('DROP FUNCTION job_notify()')
+    op.drop_index('ix_job_kind_id', table_name='job')
+    op.drop_index('ix_job_running_locked_at', table_name='job')
+    op.drop_index('ix_job_queued_run_at', table_name='job')
+    op.drop_table('job')
+    op.execute('DROP TYPE jobstatus')
@@ -0,0 +1,46 @@
+"""Spread table_version bumps over free shards
+
+Like the dashboard counters (e6b0c3f9a817), the versions were sharded by
+pg_backend_pid() % 8, so a long transaction held its shard's version row
+and blocked every writer on a connection with the same shard until it
+committed. The bump now uses counter_shard(), which gives each writing
+transaction a shard that no other open transaction holds.
+
+Revision ID: a4d7e2b9c510
+Revises: e6b0c3f9a817
+Create Date: 2026-10-18 12:06:17.935102
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7e2b9c510'
+down_revision = 'e6b0c3f9a817'
+branch_labels = None
+depends_on = None
+
+PREVIOUS_SHARD = 'pg_backend_pid() % 8'
+
+
+def _replace_bump(shard):
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION table_version_bump() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO table_version (table_name, shard, version, changed_at)
+            VALUES (TG_TABLE_NAME, {shard}, 1, now())
+            ON CONFLICT (table_name, shard) DO UPDATE
+            SET version = table_version.version + 1,
+                changed_at = greatest(table_version.changed_at, EXCLUDED.changed_at);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+
+def upgrade():
+    _replace_bump('counter_shard()')
+
+
+def downgrade():
+    _replace_bump(PREVIOUS_SHARD)
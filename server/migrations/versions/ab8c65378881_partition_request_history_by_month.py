@@ -0,0 +1,128 @@
+"""Partition request_history by month and key it properly
+
+Revision ID: ab8c65378881
+Revises: c2d1c1a88faa
+Create Date: 2026-10-18 08:49:29.935358
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'ab8c65378881'
+down_revision = 'c2d1c1a88faa'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+
+def upgrade():
+    op.execute('ALTER TABLE request_history RENAME TO request_history_old')
+    op.execute('ALTER TABLE request_history_old DROP CONSTRAINT IF EXISTS request_history_request_id_fkey')
+    # A table built from the models (or by downgrade()) has a serial key whose names are reused below
+    op.execute('ALTER TABLE request_history_old DROP CONSTRAINT IF EXISTS request_history_pkey')
+    op.execute('ALTER TABLE request_history_old ALTER COLUMN id DROP DEFAULT')
+    op.execute('DROP SEQUENCE IF EXISTS request_history_id_seq')
+
+    op.execute('CREATE SEQUENCE request_history_id_seq')
+    op.execute("""
+        CREATE TABLE request_history (
+            id INTEGER NOT NULL DEFAULT nextval('request_history_id_seq'),
+            request_id INTEGER NOT NULL REFERENCES request (id),
+            status requeststatus NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE,
+            comments TEXT,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT request_history_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute('ALTER SEQUENCE request_history_id_seq OWNED BY request_history.id')
+
+    # Creates any missing monthly partitions, bounded in UTC, starting at the
+    # month of start_month. Run ahead of time via `flask create_history_partitions`.
+    op.execute("""
+        CREATE FUNCTION request_history_ensure_partitions(start_month date, months integer)
+        RETURNS integer AS $$
+        DECLARE
+            month_start date := date_trunc('month', start_month)::date;
+            partition_name text;
+            created integer := 0;
+        BEGIN
+            FOR i IN 1..months LOOP
+                partition_name := format('request_history_%s', to_char(month_start, 'YYYY_MM'));
+                IF to_regclass(partition_name) IS NULL THEN
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF request_history FOR VALUES FROM (%L) TO (%L)',
+                        partition_name,
+                        month_start::timestamp AT TIME ZONE 'UTC',
+                        (month_start + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+                    );
+                    created := created + 1;
+                END IF;
+                month_start := (month_start + interval '1 month')::date;
+            END LOOP;
+            RETURN created;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # Safety net for rows outside every monthly partition
+    op.execute('CREATE TABLE request_history_default PARTITION OF request_history DEFAULT')
+    op.execute(f"""
+        DO $$
+        DECLARE
+            first_month date := date_trunc('month', coalesce(
+                (SELECT min(coalesce(created_at, updated_at)) FROM request_history_old), now()))::date;
+            span interval := age(date_trunc('month', now()), first_month);
+        BEGIN
+            PERFORM request_history_ensure_partitions(
+                first_month,
+                (extract(year FROM span) * 12 + extract(month FROM span))::integer + 1 + {MONTHS_AHEAD}
+            );
+        END;
+        $$
+    """)
+
+    # Migration 9d564e96b176 left id = 0 on old rows, so every row is renumbered
+    op.execute("""
+        INSERT INTO request_history (request_id, status, updated_at, comments, created_at)
+        SELECT request_id, status, updated_at, comments, coalesce(created_at, updated_at, now())
+        FROM request_history_old
+        ORDER BY coalesce(created_at, updated_at, now())
+    """)
+    op.execute('DROP TABLE request_history_old')
+
+    # Indexes on the parent are created on every partition
+    op.create_index('ix_request_history_request_id_created_at', 'request_history',
+                    ['request_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_request_history_created_at_brin', 'request_history', ['created_at'],
+                    unique=False, postgresql_using='brin')
+    op.create_index('ix_request_history_updated_at_brin', 'request_history', ['updated_at'],
+                    unique=False, postgresql_using='brin')
+
+
+def downgrade():
+    op.execute('ALTER TABLE request_history RENAME TO request_history_partitioned')
+    op.execute("""
+        CREATE TABLE request_history (
+            request_id INTEGER NOT NULL,
+            status requeststatus NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE,
+            comments TEXT,
+            created_at TIMESTAMP WITH TIME ZONE,
+            id INTEGER NOT NULL,
+            -- Named, as the partitioned table still holds the default name
+            CONSTRAINT request_history_request_id_fkey FOREIGN KEY (request_id) REFERENCES request (id)
+        )
+    """)
+    op.execute("""
+        INSERT INTO request_history (request_id, status, updated_at, comments, created_at, id)
+        SELECT request_id, status, updated_at, comments, created_at, id FROM request_history_partitioned
+    """)
+    # Drops request_history_id_seq with it, so the serial column is rebuilt after
+    op.execute('DROP TABLE request_history_partitioned')
+    op.execute('DROP FUNCTION request_history_ensure_partitions(date, integer)')
+    op.execute('CREATE SEQUENCE request_history_id_seq OWNED BY request_history.id')
+    op.execute("SELECT setval('request_history_id_seq', coalesce(max(id), 0) + 1, false) FROM request_history")
+    op.execute("ALTER TABLE request_history ALTER COLUMN id SET DEFAULT nextval('request_history_id_seq')")
+    op.execute('ALTER TABLE request_history ADD CONSTRAINT request_history_pkey PRIMARY KEY (id)')
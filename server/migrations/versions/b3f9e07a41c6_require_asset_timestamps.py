@@ -0,0 +1,35 @@
+"""Require asset.created_at and updated_at, online
+
+Both are listing sort keys; a NULL in the last row of a page made the
+keyset comparison unknown and ended the listing early.
+
+Revision ID: b3f9e07a41c6
+Revises: d81f4a6c2e57
+Create Date: 2026-10-18 11:12:09.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import add_not_null, backfill
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f9e07a41c6'
+down_revision = 'd81f4a6c2e57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    backfill('asset', 'created_at = coalesce(created_at, updated_at, now()), '
+                      'updated_at = coalesce(updated_at, created_at, now())',
+             where='created_at IS NULL OR updated_at IS NULL')
+    add_not_null('asset', 'created_at')
+    add_not_null('asset', 'updated_at')
+
+
+def downgrade():
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(timezone=True), nullable=True)
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(timezone=True), nullable=True)
@@ -0,0 +1,39 @@
+"""Add full-text and trigram search indexes on asset
+
+Revision ID: c2d1c1a88faa
+Revises: 2fd29c305b4d
+Create Date: 2026-10-18 08:47:53.302283
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d1c1a88faa'
+down_revision = '2fd29c305b4d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # A stored generated column keeps the vector in sync on every write
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+            persisted=True,
+        ), nullable=True))
+        batch_op.create_index('ix_asset_search_vector', ['search_vector'], unique=False, postgresql_using='gin')
+        batch_op.create_index('ix_asset_name_trgm', ['name'], unique=False, postgresql_using='gin',
+                              postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.drop_index('ix_asset_name_trgm')
+        batch_op.drop_index('ix_asset_search_vector')
+        batch_op.drop_column('search_vector')
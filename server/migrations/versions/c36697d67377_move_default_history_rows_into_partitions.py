@@ -0,0 +1,79 @@
+"""Move default-partition rows when creating a request_history partition
+
+When `flask create_history_partitions` was missed, history rows for the
+uncovered month landed in request_history_default, and creating that
+month's partition afterwards failed because the default held matching
+rows, so no partition could be added again. The default partition is now
+detached, the month's rows are moved into the new partition and the
+default is attached again, all in the creating transaction.
+
+Revision ID: c36697d67377
+Revises: c91f5b3e6d28
+Create Date: 2026-10-18 13:02:51.384106
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c36697d67377'
+down_revision = 'c91f5b3e6d28'
+branch_labels = None
+depends_on = None
+
+# Creates the partition of one month
+CREATE_PARTITION = """
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF request_history FOR VALUES FROM (%L) TO (%L)',
+                        partition_name, lower_bound, upper_bound
+                    );"""
+
+# Same, first taking the month's rows out of the default partition, which
+# would otherwise make the CREATE fail
+MOVE_AND_CREATE_PARTITION = """
+                    IF EXISTS (SELECT 1 FROM request_history_default
+                               WHERE created_at >= lower_bound AND created_at < upper_bound) THEN
+                        ALTER TABLE request_history DETACH PARTITION request_history_default;""" + CREATE_PARTITION + """
+                        WITH moved AS (
+                            DELETE FROM request_history_default
+                            WHERE created_at >= lower_bound AND created_at < upper_bound
+                            RETURNING *
+                        )
+                        INSERT INTO request_history SELECT * FROM moved;
+                        ALTER TABLE request_history ATTACH PARTITION request_history_default DEFAULT;
+                    ELSE""" + CREATE_PARTITION + """
+                    END IF;"""
+
+
+def _replace_function(create_partition):
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION request_history_ensure_partitions(start_month date, months integer)
+        RETURNS integer AS $$
+        DECLARE
+            month_start date := date_trunc('month', start_month)::date;
+            partition_name text;
+            lower_bound timestamptz;
+            upper_bound timestamptz;
+            created integer := 0;
+        BEGIN
+            FOR i IN 1..months LOOP
+                partition_name := format('request_history_%s', to_char(month_start, 'YYYY_MM'));
+                IF to_regclass(partition_name) IS NULL THEN
+                    lower_bound := month_start::timestamp AT TIME ZONE 'UTC';
+                    upper_bound := (month_start + interval '1 month')::timestamp AT TIME ZONE 'UTC';{create_partition}
+                    created := created + 1;
+                END IF;
+                month_start := (month_start + interval '1 month')::date;
+            END LOOP;
+            RETURN created;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+
+def upgrade():
+    _replace_function(MOVE_AND_CREATE_PARTITION)
+
+
+def downgrade():
+    _replace_function(CREATE_PARTITION)
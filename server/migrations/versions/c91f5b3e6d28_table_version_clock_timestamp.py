@@ -0,0 +1,43 @@
+"""Stamp table_version.changed_at with the statement's clock time
+
+now() is the start of the writing transaction, so a transaction that
+began before a response was served could commit a write stamped earlier
+than that response's Last-Modified, and If-Modified-Since clients kept a
+stale copy. clock_timestamp() is taken when the statement runs.
+
+Revision ID: c91f5b3e6d28
+Revises: a4d7e2b9c510
+Create Date: 2026-10-18 12:31:40.227819
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c91f5b3e6d28'
+down_revision = 'a4d7e2b9c510'
+branch_labels = None
+depends_on = None
+
+
+def _replace_bump(changed_at):
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION table_version_bump() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO table_version (table_name, shard, version, changed_at)
+            VALUES (TG_TABLE_NAME, counter_shard(), 1, {changed_at})
+            ON CONFLICT (table_name, shard) DO UPDATE
+            SET version = table_version.version + 1,
+                changed_at = greatest(table_version.changed_at, EXCLUDED.changed_at);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+
+def upgrade():
+    _replace_bump('clock_timestamp()')
+
+
+def downgrade():
+    _replace_bump('now()')
@@ -0,0 +1,35 @@
+"""Index the request foreign keys and require request.created_at, online
+
+Revision ID: d81f4a6c2e57
+Revises: 7c1e5a9b3d20
+Create Date: 2026-10-18 10:02:41.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import add_not_null, backfill, create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f4a6c2e57'
+down_revision = '7c1e5a9b3d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Deleting an asset or user checked every request row for references
+    create_index_concurrently('ix_request_user_id', 'request', ['user_id'])
+    create_index_concurrently('ix_request_asset_id', 'request', ['asset_id'])
+
+    backfill('request', 'created_at = coalesce(updated_at, now())', where='created_at IS NULL')
+    add_not_null('request', 'created_at')
+
+
+def downgrade():
+    with op.batch_alter_table('request', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(timezone=True), nullable=True)
+
+    drop_index_concurrently('ix_request_asset_id', 'request')
+    drop_index_concurrently('ix_request_user_id', 'request')
@@ -0,0 +1,105 @@
+"""Spread dashboard counter writes over free shards
+
+The counters were sharded by pg_backend_pid() % 8. A pooled connection
+keeps its pid, so a long transaction (bulk import, decisions, a backfill)
+held its shard's counter rows until commit and every transaction on a
+connection with the same shard waited behind it. counter_shard() instead
+gives each writing transaction a shard that no other open transaction
+holds, tracked with transaction-level advisory locks, so writers only
+wait when all SHARDS are taken.
+
+Revision ID: e6b0c3f9a817
+Revises: b3f9e07a41c6
+Create Date: 2026-10-18 11:48:52.610374
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b0c3f9a817'
+down_revision = 'b3f9e07a41c6'
+branch_labels = None
+depends_on = None
+
+SHARDS = 32
+PREVIOUS_SHARD = 'pg_backend_pid() % 8'
+
+# table -> (dimension, column) pairs counted for it; as in 2fd29c305b4d
+DIMENSIONS = {
+    'asset': [('asset_status', 'status'), ('asset_category', 'category_id')],
+    'request': [('request_status', 'status'), ('request_urgency', 'urgency')],
+}
+
+
+def _deltas(dimensions, rows, sign):
+    return ' UNION ALL '.join(
+        f"SELECT '{dimension}' AS dimension, {column}::text AS key, {sign} AS delta FROM {rows}"
+        for dimension, column in dimensions
+    )
+
+
+def _apply(deltas, shard):
+    # Rows are written in a fixed order so concurrent statements cannot deadlock
+    return f"""
+        INSERT INTO dashboard_counter (dimension, key, shard, count)
+        SELECT dimension, key, {shard}, sum(delta)
+        FROM ({deltas}) AS deltas
+        GROUP BY dimension, key
+        HAVING sum(delta) <> 0
+        ORDER BY dimension, key
+        ON CONFLICT (dimension, key, shard)
+        DO UPDATE SET count = dashboard_counter.count + EXCLUDED.count;
+    """
+
+
+def _replace_functions(shard):
+    for table, dimensions in DIMENSIONS.items():
+        inserted = _apply(_deltas(dimensions, 'new_rows', 1), shard)
+        deleted = _apply(_deltas(dimensions, 'old_rows', -1), shard)
+        updated = _apply(_deltas(dimensions, 'new_rows', 1) + ' UNION ALL ' + _deltas(dimensions, 'old_rows', -1),
+                         shard)
+        op.execute(f"""
+            CREATE OR REPLACE FUNCTION dashboard_count_{table}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN {inserted}
+                ELSIF TG_OP = 'DELETE' THEN {deleted}
+                ELSE {updated}
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+
+def upgrade():
+    # The shard is kept for the rest of the transaction, and so is its
+    # advisory lock, so later statements use the same rows. Starting from
+    # the transaction id spreads the search; when every shard is taken the
+    # last one tried is used and the writer waits for its row locks.
+    op.execute(f"""
+        CREATE FUNCTION counter_shard() RETURNS integer AS $$
+        DECLARE
+            shard integer := nullif(current_setting('counter.shard', true), '')::integer;
+            start integer;
+        BEGIN
+            IF shard IS NOT NULL THEN
+                RETURN shard;
+            END IF;
+            start := txid_current() % {SHARDS};
+            FOR i IN 0..{SHARDS - 1} LOOP
+                shard := (start + i) % {SHARDS};
+                EXIT WHEN pg_try_advisory_xact_lock(hashtext('counter_shard'), shard);
+            END LOOP;
+            PERFORM set_config('counter.shard', shard::text, true);
+            RETURN shard;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    _replace_functions('counter_shard()')
+
+
+def downgrade():
+    # Rows already written to shards 8 and up still count; readers sum every shard
+    _replace_functions(PREVIOUS_SHARD)
+    op.execute('DROP FUNCTION counter_shard()')
@@ -0,0 +1,29 @@
+"""Add indexes backing the asset listing filters
+
+Revision ID: f77ce6f492ae
+Revises: 9d564e96b176
+Create Date: 2026-10-18 08:38:03.622176
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f77ce6f492ae'
+down_revision = '9d564e96b176'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.create_index('ix_asset_status_category_id_id', ['status', 'category_id', 'id'], unique=False)
+        batch_op.create_index('ix_asset_category_id_id', ['category_id', 'id'], unique=False)
+        batch_op.create_index('ix_asset_allocated_to', ['allocated_to'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.drop_index('ix_asset_allocated_to')
+        batch_op.drop_index('ix_asset_category_id_id')
+        batch_op.drop_index('ix_asset_status_category_id_id')
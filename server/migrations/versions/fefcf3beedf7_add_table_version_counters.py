@@ -0,0 +1,61 @@
+"""Add per-table write counters for conditional GET
+
+Revision ID: fefcf3beedf7
+Revises: ab8c65378881
+Create Date: 2026-10-18 08:52:33.885421
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fefcf3beedf7'
+down_revision = 'ab8c65378881'
+branch_labels = None
+depends_on = None
+
+SHARDS = 8
+
+TABLES = ['user', 'category', 'asset', 'request', 'request_history']
+
+
+def upgrade():
+    op.create_table('table_version',
+        sa.Column('table_name', sa.String(length=64), nullable=False),
+        sa.Column('shard', sa.SmallInteger(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('changed_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('table_name', 'shard')
+    )
+
+    # One bump per statement, whatever the row count, including statements
+    # that touch no rows; a spurious bump only costs clients one full fetch.
+    op.execute(f"""
+        CREATE FUNCTION table_version_bump() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO table_version (table_name, shard, version, changed_at)
+            VALUES (TG_TABLE_NAME, pg_backend_pid() % {SHARDS}, 1, now())
+            ON CONFLICT (table_name, shard) DO UPDATE
+            SET version = table_version.version + 1,
+                changed_at = greatest(table_version.changed_at, EXCLUDED.changed_at);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in TABLES:
+        op.execute(f"""
+            CREATE TRIGGER table_version_{table} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "{table}"
+            FOR EACH STATEMENT EXECUTE FUNCTION table_version_bump();
+        """)
+        op.execute(f"""
+            INSERT INTO table_version (table_name, shard, version, changed_at)
+            SELECT '{table}', 0, 1, coalesce(max(updated_at), now()) FROM "{table}"
+        """)
+
+
+def downgrade():
+    for table in TABLES:
+        op.execute(f'DROP TRIGGER table_version_{table} ON "{table}"')
+    op.execute('DROP FUNCTION table_version_bump()')
+    op.drop_table('table_version')
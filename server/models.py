@@ -1,6 +1,8 @@
 from datetime import datetime, timezone
 from enum import Enum
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from database import db
+from serializers import Serializer
 
 # Enums for user roles and statuses
 class UserRole(Enum):
@@ -27,6 +29,12 @@ class RequestStatus(Enum):
     Approved = "Approved"
     Rejected = "Rejected"
 
+class JobStatus(Enum):
+    Queued = "Queued"
+    Running = "Running"
+    Succeeded = "Succeeded"
+    Failed = "Failed"
+
 # User model
 class User(db.Model):
     __tablename__ = 'user'  
@@ -41,11 +49,7 @@ class User(db.Model):
     
     @property
     def serialize(self):
-        return {
-            'id': self.id,
-            'username': self.username,
-            'email': self.email
-        }
+        return self.serializer.dump(self)
 
     # Relationships
     requests = db.relationship('Request', back_populates='user', cascade='all, delete-orphan', lazy=True)
@@ -55,6 +59,15 @@ class User(db.Model):
 # Asset model
 class Asset(db.Model):
     __tablename__ = 'asset'
+    __table_args__ = (
+        # Serve the inventory filters (status / category / holder) with keyset order on id
+        db.Index('ix_asset_status_category_id_id', 'status', 'category_id', 'id'),
+        db.Index('ix_asset_category_id_id', 'category_id', 'id'),
+        db.Index('ix_asset_allocated_to', 'allocated_to'),
+        # Full-text and trigram search (migration c2d1c1a88faa)
+        db.Index('ix_asset_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_asset_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
@@ -63,22 +76,19 @@ class Asset(db.Model):
     status = db.Column(db.Enum(AssetStatus), nullable=False)
     image_url = db.Column(db.Text)
     allocated_to = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    # NOT NULL: both are keyset sort keys (ASSET_SORT_KEYS in queries.py)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    # Maintained by Postgres on every write; deferred so ORM loads never fetch it
+    search_vector = db.deferred(db.Column(TSVECTOR, db.Computed(
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+        persisted=True,
+    )))
 
     @property
     def serialize(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description,
-            'category_id': self.category_id,
-            'status': self.status,
-            'image_url': self.image_url,
-            'allocated_to': self.allocated_to,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at
-        }
+        return self.serializer.dump(self)
     
     # Relationships
     category = db.relationship('Category', backref='assets', lazy=True)
@@ -97,19 +107,18 @@ class Category(db.Model):
 
     @property
     def serialize(self):
-        return {
-            'id': self.id,
-            'category_name': self.category_name,
-            'description': self.description,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at
-        }
+        return self.serializer.dump(self)
 
 
 # Request model
 class Request(db.Model):
     __tablename__ = 'request' 
-    
+    __table_args__ = (
+        # Built CONCURRENTLY by migration d81f4a6c2e57
+        db.Index('ix_request_user_id', 'user_id'),
+        db.Index('ix_request_asset_id', 'asset_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'), nullable=True)
@@ -118,23 +127,12 @@ class Request(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     urgency = db.Column(db.Enum(UrgencyLevel), nullable=False)
     status = db.Column(db.Enum(RequestStatus), nullable=False)
-    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     @property
     def serialize(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'asset_id': self.asset_id,
-            'request_type': self.request_type,
-            'reason': self.reason,
-            'quantity': self.quantity,
-            'urgency': self.urgency,
-            'status': self.status,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at
-        }
+        return self.serializer.dump(self)
         
     # Relationships
     user = db.relationship('User', back_populates='requests', lazy=True)
@@ -143,26 +141,104 @@ class Request(db.Model):
 
 
 # RequestHistory model
+# Append-only and range-partitioned by month on created_at (migration
+# ab8c65378881), so created_at is part of the primary key.
 class RequestHistory(db.Model):
     __tablename__ = 'request_history'
+    __table_args__ = (
+        # Per-request timelines are read straight off this index in order
+        db.Index('ix_request_history_request_id_created_at', 'request_id', 'created_at', 'id'),
+        # Date-range audits
+        db.Index('ix_request_history_created_at_brin', 'created_at', postgresql_using='brin'),
+        db.Index('ix_request_history_updated_at_brin', 'updated_at', postgresql_using='brin'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
     
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, db.Sequence('request_history_id_seq'), primary_key=True,
+                   server_default=db.text("nextval('request_history_id_seq')"))
     request_id = db.Column(db.Integer, db.ForeignKey('request.id'), nullable=False)
     status = db.Column(db.Enum(RequestStatus), nullable=False)
     updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     comments = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime(timezone=True), primary_key=True, nullable=False,
+                           default=lambda: datetime.now(timezone.utc), server_default=db.func.now())
     
     @property
     def serialize(self):
-        return {
-            'id': self.id,
-            'request_id': self.request_id,
-            'status': self.status,
-            'updated_at': self.updated_at,
-            'comments': self.comments,
-            'created_at': self.created_at
-        }
+        return self.serializer.dump(self)
     
     # Relationships
-    request = db.relationship('Request', back_populates='history', lazy=True)
\ No newline at end of file
+    request = db.relationship('Request', back_populates='history', lazy=True)
+
+
+# Dashboard counters, maintained by statement-level triggers on asset and
+# request (migration 2fd29c305b4d). Each counter is split over shards, and
+# counter_shard() gives every writing transaction one that no other open
+# transaction holds (migration e6b0c3f9a817); readers sum the shards.
+class DashboardCounter(db.Model):
+    __tablename__ = 'dashboard_counter'
+
+    dimension = db.Column(db.String(32), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    shard = db.Column(db.SmallInteger, primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+# Write counters behind the ETags in conditional.py, bumped once per statement
+# by triggers on every served table (migration fefcf3beedf7). Sharded with
+# counter_shard() like the dashboard counters; a table's version is the shard sum.
+class TableVersion(db.Model):
+    __tablename__ = 'table_version'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    shard = db.Column(db.SmallInteger, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+# Background jobs, claimed by `flask worker` processes with FOR UPDATE SKIP
+# LOCKED (see jobs.py). Inserts NOTIFY idle workers (migration 7c1e5a9b3d20).
+class Job(db.Model):
+    __tablename__ = 'job'
+    __table_args__ = (
+        # Workers only ever look for due, queued jobs and for expired leases
+        db.Index('ix_job_queued_run_at', 'run_at', 'id', postgresql_where=db.text("status = 'Queued'")),
+        db.Index('ix_job_running_locked_at', 'locked_at', postgresql_where=db.text("status = 'Running'")),
+        db.Index('ix_job_kind_id', 'kind', 'id'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    payload = db.Column(JSONB, nullable=False, default=dict)
+    status = db.Column(db.Enum(JobStatus), nullable=False, default=JobStatus.Queued)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+    locked_by = db.Column(db.String(255))
+    locked_at = db.Column(db.DateTime(timezone=True))
+    result = db.Column(JSONB)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    finished_at = db.Column(db.DateTime(timezone=True))
+
+    @property
+    def serialize(self):
+        return self.serializer.dump(self)
+
+# Serialized fields per model, compiled once at import; see serializers.py
+User.serializer = Serializer(User, ('id', 'username', 'email'))
+Asset.serializer = Serializer(Asset, (
+    'id', 'name', 'description', 'category_id', 'status', 'image_url',
+    'allocated_to', 'created_at', 'updated_at',
+))
+Category.serializer = Serializer(Category, ('id', 'category_name', 'description', 'created_at', 'updated_at'))
+Request.serializer = Serializer(Request, (
+    'id', 'user_id', 'asset_id', 'request_type', 'reason', 'quantity',
+    'urgency', 'status', 'created_at', 'updated_at',
+))
+RequestHistory.serializer = Serializer(RequestHistory, (
+    'id', 'request_id', 'status', 'updated_at', 'comments', 'created_at',
+))
+Job.serializer = Serializer(Job, (
+    'id', 'kind', 'status', 'payload', 'attempts', 'max_attempts', 'run_at', 'result', 'error',
+    'created_at', 'updated_at', 'finished_at',
+))
@@ -0,0 +1,246 @@
+"""Helpers for Alembic migrations that run against a live database.
+
+A plain UPDATE of a big table, or CREATE INDEX or ADD CONSTRAINT on it, holds
+its locks until the migration's transaction ends, and blocks the
+application's writes for all that time. These helpers run in autocommit
+blocks instead, so they commit whatever the migration did before them:
+
+    from online_migrations import add_not_null, backfill, create_index_concurrently
+
+    def upgrade():
+        create_index_concurrently('ix_request_user_id', 'request', ['user_id'])
+        backfill('request', 'created_at = coalesce(updated_at, now())', where='created_at IS NULL')
+        add_not_null('request', 'created_at')
+
+- backfill() updates one key range per statement, committing a checkpoint
+  with every batch. A migration that is interrupted resumes after the last
+  committed batch when it is run again.
+- Indexes are built CONCURRENTLY. An invalid index left by a failed build
+  is dropped and built again.
+- Constraints are added NOT VALID, which checks new rows only and holds its
+  lock briefly. validate_constraint() then checks the existing rows without
+  blocking writes.
+- Statements that need an exclusive lock run with a short lock_timeout and
+  are retried, so the queries queued behind them are never stuck waiting.
+
+Every helper can be re-run after a failure. Progress is logged under
+`alembic.`, so the logging setup in alembic.ini shows it.
+"""
+import logging
+import time
+
+from alembic import op
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(f'alembic.{__name__}')
+
+CHECKPOINTS = 'online_migration_checkpoint'
+LOCK_TIMEOUT = '2s'
+LOCK_RETRIES = 10
+LOCK_NOT_AVAILABLE = '55P03'
+BATCH_SIZE = 10000
+REPORT_INTERVAL = 10
+
+
+def _connection():
+    if op.get_context().as_sql:
+        raise RuntimeError('Online migrations need a database connection and cannot run with --sql')
+    return op.get_bind()
+
+
+def _quote(conn, name):
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def _set(conn, **settings):
+    # Session level: in autocommit mode every statement is its own transaction
+    for name, value in settings.items():
+        conn.execute(text('SELECT set_config(:name, :value, false)'), {'name': name, 'value': str(value)})
+
+
+def _with_lock_retries(conn, description, fn):
+    """Run `fn` with a short lock_timeout, retrying when the lock is not granted in time."""
+    for attempt in range(1, LOCK_RETRIES + 1):
+        _set(conn, lock_timeout=LOCK_TIMEOUT)
+        try:
+            return fn()
+        except OperationalError as e:
+            if getattr(e.orig, 'pgcode', None) != LOCK_NOT_AVAILABLE or attempt == LOCK_RETRIES:
+                raise
+            delay = min(30, 2 ** attempt / 4)
+            logger.warning('%s: lock not available, retrying in %.1fs (%d/%d)', description, delay, attempt,
+                           LOCK_RETRIES)
+            time.sleep(delay)
+        finally:
+            conn.execute(text('RESET lock_timeout'))
+
+
+def _without_statement_timeout(conn, description, fn):
+    # Index builds and validations scan the whole table; the application's
+    # statement_timeout (DB_STATEMENT_TIMEOUT_MS) is sized for requests
+    _set(conn, statement_timeout=0)
+    started = time.monotonic()
+    try:
+        fn()
+    finally:
+        conn.execute(text('RESET statement_timeout'))
+    logger.info('%s done in %.1fs', description, time.monotonic() - started)
+
+
+def _constraint(conn, name, table):
+    """True if constraint `name` on `table` is validated, False if NOT VALID, None if missing."""
+    return conn.execute(
+        text('SELECT convalidated FROM pg_constraint WHERE conname = :name AND conrelid = to_regclass(:table)'),
+        {'name': name, 'table': _quote(conn, table)},
+    ).scalar()
+
+
+def create_index_concurrently(name, table, columns, **kw):
+    """op.create_index() without blocking writes to `table`."""
+    with op.get_context().autocommit_block():
+        conn = _connection()
+        valid = conn.execute(text('SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'),
+                             {'name': _quote(conn, name)}).scalar()
+        if valid is False:
+            logger.warning('Dropping invalid index %s left by an earlier attempt', name)
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+        _without_statement_timeout(conn, f'Index {name}', lambda: op.create_index(
+            name, table, columns, postgresql_concurrently=True, if_not_exists=True, **kw))
+
+
+def drop_index_concurrently(name, table):
+    """op.drop_index() without blocking reads or writes on `table`."""
+    with op.get_context().autocommit_block():
+        conn = _connection()
+        _without_statement_timeout(conn, f'Dropping index {name}', lambda: op.drop_index(
+            name, table_name=table, postgresql_concurrently=True, if_exists=True))
+
+
+def _add_check(conn, name, table, condition):
+    if _constraint(conn, name, table) is None:
+        _with_lock_retries(conn, f'Adding {name}', lambda: op.create_check_constraint(
+            name, table, condition, postgresql_not_valid=True))
+
+
+def _validate(conn, name, table):
+    if not _constraint(conn, name, table):
+        _without_statement_timeout(conn, f'Validating {name}', lambda: conn.execute(text(
+            f'ALTER TABLE {_quote(conn, table)} VALIDATE CONSTRAINT {_quote(conn, name)}')))
+
+
+def add_check_not_valid(name, table, condition):
+    """Add CHECK (`condition`) for new and updated rows only; see validate_constraint()."""
+    with op.get_context().autocommit_block():
+        _add_check(_connection(), name, table, condition)
+
+
+def add_foreign_key_not_valid(name, source, referent, local_cols, remote_cols, **kw):
+    """op.create_foreign_key() for new and updated rows only; see validate_constraint()."""
+    with op.get_context().autocommit_block():
+        conn = _connection()
+        if _constraint(conn, name, source) is None:
+            _with_lock_retries(conn, f'Adding {name}', lambda: op.create_foreign_key(
+                name, source, referent, local_cols, remote_cols, postgresql_not_valid=True, **kw))
+
+
+def validate_constraint(name, table):
+    """Check the existing rows against a NOT VALID constraint while writes go on."""
+    with op.get_context().autocommit_block():
+        _validate(_connection(), name, table)
+
+
+def add_not_null(table, column):
+    """Make `column` NOT NULL without holding an exclusive lock while the table is scanned.
+
+    A validated CHECK (column IS NOT NULL) lets Postgres skip that scan. Run
+    a backfill first; validation fails while NULLs remain.
+    """
+    name = f'{table}_{column}_not_null'
+    with op.get_context().autocommit_block():
+        conn = _connection()
+        _add_check(conn, name, table, f'{_quote(conn, column)} IS NOT NULL')
+        _validate(conn, name, table)
+        _with_lock_retries(conn, f'Setting {table}.{column} NOT NULL',
+                           lambda: op.alter_column(table, column, nullable=False))
+        _with_lock_retries(conn, f'Dropping {name}', lambda: op.drop_constraint(name, table, type_='check'))
+
+
+def backfill(table, values, where=None, key='id', batch_size=BATCH_SIZE, pause=0.0, name=None):
+    """UPDATE `table` SET `values` [WHERE `where`], one committed batch of keys at a time.
+
+    `values` and `where` are SQL; `key` must be a unique integer column,
+    usually the primary key, and sets the order of the batches. `pause`
+    seconds between batches leaves room for replication and vacuum to keep
+    up. Batches are checkpointed under `name` (by default the table and
+    values), so a re-run resumes after the last one committed. Rows with
+    keys above the largest one present at the start are left alone.
+    Returns the number of rows updated.
+    """
+    name = name or f'{table}: {values}'
+    with op.get_context().autocommit_block():
+        conn = _connection()
+        quoted, key = _quote(conn, table), _quote(conn, key)
+        conn.execute(text(f'''
+            CREATE TABLE IF NOT EXISTS {CHECKPOINTS} (
+                name text PRIMARY KEY,
+                last_key bigint NOT NULL,
+                rows bigint NOT NULL,
+                updated_at timestamp with time zone NOT NULL
+            )
+        '''))
+        low, high = conn.execute(text(f'SELECT min({key}), max({key}) FROM {quoted}')).first()
+        checkpoint = conn.execute(text(f'SELECT last_key, rows FROM {CHECKPOINTS} WHERE name = :name'),
+                                  {'name': name}).first()
+        last, done = checkpoint if checkpoint else ((low or 0) - 1, 0)
+        if checkpoint:
+            logger.info('Backfill %s: resuming after %s %d, %d rows updated so far', name, key, last, done)
+
+        next_key = text(f'''
+            SELECT max({key}) FROM (
+                SELECT {key} FROM {quoted} WHERE {key} > :last AND {key} <= :high ORDER BY {key} LIMIT :n
+            ) batch
+        ''')
+        # The update and its checkpoint commit together, as one statement
+        update = text(f'''
+            WITH updated AS (
+                UPDATE {quoted} SET {values}
+                WHERE {key} > :last AND {key} <= :upto{f' AND ({where})' if where else ''}
+                RETURNING 1
+            ), saved AS (
+                INSERT INTO {CHECKPOINTS} (name, last_key, rows, updated_at)
+                SELECT :name, :upto, count(*), now() FROM updated
+                ON CONFLICT (name) DO UPDATE
+                SET last_key = excluded.last_key, rows = {CHECKPOINTS}.rows + excluded.rows,
+                    updated_at = excluded.updated_at
+            )
+            SELECT count(*) FROM updated
+        ''')
+
+        started = reported = time.monotonic()
+        first, updated = last, 0
+        while high is not None:
+            upto = conn.execute(next_key, {'last': last, 'high': high, 'n': batch_size}).scalar()
+            if upto is None:
+                break
+            updated += _with_lock_retries(conn, f'Backfill {name}', lambda: conn.execute(
+                update, {'name': name, 'last': last, 'upto': upto}).scalar())
+            last = upto
+            now = time.monotonic()
+            if now - reported >= REPORT_INTERVAL:
+                reported = now
+                logger.info('Backfill %s: %d rows updated, %.0f%% of keys, about %.0fs left', name,
+                            done + updated, (last - low + 1) / (high - low + 1) * 100,
+                            (now - started) * (high - last) / (last - first))
+            if pause:
+                time.sleep(pause)
+
+        conn.execute(text(f'DELETE FROM {CHECKPOINTS} WHERE name = :name'), {'name': name})
+        # Leave no trace for autogenerate once every backfill has finished
+        conn.execute(text(f'''
+            DO $$ BEGIN
+                IF NOT EXISTS (SELECT FROM {CHECKPOINTS}) THEN DROP TABLE {CHECKPOINTS}; END IF;
+            END $$
+        '''))
+        logger.info('Backfill %s: done, %d rows updated in %.1fs', name, done + updated, time.monotonic() - started)
+    return done + updated
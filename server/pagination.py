@@ -0,0 +1,118 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import DateTime, tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+
+class PaginationError(ValueError):
+    """Raised when a client sends a malformed cursor or limit."""
+
+
+def encode_cursor(*values):
+    """Turn the sort key of the last row on a page into an opaque token."""
+    payload = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _load_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+    if not isinstance(values, list):
+        raise PaginationError('Invalid cursor')
+    return values
+
+
+def decode_cursor(token, keys):
+    """Decode a token produced by `encode_cursor` back into typed key values."""
+    values = _load_cursor(token)
+    if len(values) != len(keys):
+        raise PaginationError('Invalid cursor')
+
+    decoded = []
+    for key, value in zip(keys, values):
+        if value is None:
+            # Keys are NOT NULL; a NULL bound would compare as unknown and end the listing
+            raise PaginationError('Invalid cursor')
+        if isinstance(key.type, DateTime):
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise PaginationError('Invalid cursor')
+        # Anything else would reach Postgres and fail there; bool is an int too
+        elif not isinstance(value, key.type.python_type) or isinstance(value, bool):
+            raise PaginationError('Invalid cursor')
+        decoded.append(value)
+    return decoded
+
+
+def decode_offset(token):
+    """Offset carried by an `encode_cursor(offset)` token, for ranked results
+    whose order cannot be expressed as a keyset."""
+    if not token:
+        return 0
+    values = _load_cursor(token)
+    if len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+        raise PaginationError('Invalid cursor')
+    return values[0]
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, maximum)
+
+
+def apply_keyset(query, keys, after=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """Order `query` by `keys` and restrict it to the page following `after`.
+
+    `keys` must be NOT NULL and end with a unique column (normally the
+    primary key) so the ordering is total. One extra row is fetched so
+    `split_page` can tell whether another page exists without issuing a
+    COUNT. Pass `limit=None` to get the whole remaining range, e.g. for
+    streaming.
+    """
+    if after:
+        values = decode_cursor(after, keys)
+        row_key = tuple_(*keys) if len(keys) > 1 else keys[0]
+        bound = tuple_(*values) if len(keys) > 1 else values[0]
+        query = query.filter(row_key < bound if descending else row_key > bound)
+
+    ordering = [key.desc() if descending else key.asc() for key in keys]
+    query = query.order_by(*ordering)
+    return query if limit is None else query.limit(limit + 1)
+
+
+def split_page(rows, limit, key):
+    """Trim the look-ahead row and build the cursor for the next page."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
+
+
+def iter_ndjson(rows, serialize, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield newline-delimited JSON in chunks of `chunk_size` rows."""
+    buffer = []
+    for row in rows:
+        buffer.append(current_app.json.dumps(serialize(row)))
+        if len(buffer) >= chunk_size:
+            yield '\n'.join(buffer) + '\n'
+            buffer = []
+    if buffer:
+        yield '\n'.join(buffer) + '\n'
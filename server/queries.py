@@ -0,0 +1,86 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import Asset, AssetStatus, Request, RequestStatus, UrgencyLevel
+
+# Listing filters and eager-load options shared by the Flask app and the
+# async read path (asgi.py). Everything here only builds criteria and options;
+# running them is up to the caller's session. Invalid input raises ValueError.
+
+# Only NOT NULL columns: the keyset comparison cannot page past a NULL
+ASSET_SORT_KEYS = {
+    'id': Asset.id,
+    'name': Asset.name,
+    'created_at': Asset.created_at,
+    'updated_at': Asset.updated_at,
+}
+
+
+def asset_filters(args):
+    """Translate listing query-string filters into (criteria, keyset keys, descending)."""
+    criteria = []
+    status = args.get('status')
+    if status:
+        if status not in AssetStatus.__members__:
+            raise ValueError(f'Unknown status: {status}')
+        criteria.append(Asset.status == AssetStatus[status])
+
+    for param, column in (('category_id', Asset.category_id), ('allocated_to', Asset.allocated_to)):
+        value = args.get(param)
+        if value:
+            if not value.isdigit():
+                raise ValueError(f'{param} must be an integer')
+            criteria.append(column == int(value))
+
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    sort_key = ASSET_SORT_KEYS.get(sort.lstrip('-'))
+    if sort_key is None:
+        raise ValueError(f'Cannot sort by {sort}')
+    keys = [Asset.id] if sort_key is Asset.id else [sort_key, Asset.id]
+    return criteria, keys, descending
+
+
+def request_filters(args):
+    criteria = []
+    for param, column, enum in (('status', Request.status, RequestStatus),
+                                ('urgency', Request.urgency, UrgencyLevel)):
+        value = args.get(param)
+        if value:
+            if value not in enum.__members__:
+                raise ValueError(f'Unknown {param}: {value}')
+            criteria.append(column == enum[value])
+    return criteria
+
+
+# Relations a client may ask for with ?include=. Many-to-one relations are
+# joined into the page query; history is fetched with one extra IN query.
+REQUEST_INCLUDES = {
+    'user': lambda: joinedload(Request.user),
+    'asset': lambda: joinedload(Request.asset),
+    'asset.category': lambda: joinedload(Request.asset).joinedload(Asset.category),
+    'history': lambda: selectinload(Request.history),
+}
+
+
+def parse_includes(value):
+    includes = {name.strip() for name in (value or '').split(',') if name.strip()}
+    unknown = includes - REQUEST_INCLUDES.keys()
+    if unknown:
+        raise ValueError(f"Unknown include: {', '.join(sorted(unknown))}")
+    if 'asset.category' in includes:
+        includes.add('asset')
+    return includes
+
+
+def serialize_request(req, includes, serializer=Request.serializer):
+    # ?fields= narrows the request itself; included relations stay whole
+    data = serializer.dump(req)
+    if 'user' in includes:
+        data['user'] = req.user.serialize if req.user else None
+    if 'asset' in includes:
+        data['asset'] = req.asset.serialize if req.asset else None
+        if 'asset.category' in includes and req.asset is not None:
+            data['asset']['category'] = req.asset.category.serialize
+    if 'history' in includes:
+        data['history'] = [entry.serialize for entry in req.history]
+    return data
@@ -0,0 +1,265 @@
+"""Read-replica routing for the Flask-SQLAlchemy session.
+
+Everything runs on the primary unless a view or command opts in with
+@read_only or `with reading():`. Inside those, plain SELECTs go to a healthy
+replica, picked round robin once per session. Flushes, INSERT/UPDATE/DELETE,
+SELECT ... FOR UPDATE and text() statements stay on the primary, and so
+does every read after the session has written.
+
+A thread per process checks each replica every REPLICA_CHECK_INTERVAL
+seconds. A replica whose replay lag exceeds REPLICA_MAX_LAG_SECONDS, or
+that does not answer, leaves the rotation until it catches up. Lag is
+measured against the primary's WAL position, so a replica that stopped
+streaming ages out as soon as the primary writes. With no healthy replica,
+reads fall back to the primary.
+
+A response to a request that wrote sets a short-lived cookie. Until it
+expires, @read_only views serve that client from the primary, so it
+always sees its own writes.
+"""
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, request
+from flask_sqlalchemy.session import Session
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import CompoundSelect, Select, TextClause, create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+from db_pool import WAIT_BUCKETS, InstrumentedQueuePool, pool_stats
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = 'db_primary_until'
+
+REPLICA_LAG = Gauge('db_replica_lag_seconds', 'Replay lag of each read replica', ['replica'],
+                    multiprocess_mode='livemax')
+REPLICA_HEALTHY = Gauge('db_replica_healthy', '1 while a read replica is in rotation', ['replica'],
+                        multiprocess_mode='livemin')
+# The primary's pool is reported by metrics.py; each replica's has its own stats
+REPLICA_POOL_WAIT = Histogram('db_replica_pool_checkout_wait_seconds',
+                              'Time spent waiting for a pooled replica connection', ['replica'], buckets=WAIT_BUCKETS)
+REPLICA_POOL_TIMEOUTS = Counter('db_replica_pool_checkout_timeouts_total',
+                                'Replica checkouts that gave up waiting', ['replica'])
+
+# An idle primary sends no WAL, so replay timestamps age without any real
+# lag; a replica that has replayed up to the primary's current WAL position
+# counts as current. Comparing against what the replica itself received
+# would also count one whose WAL receiver has disconnected.
+PRIMARY_LSN_QUERY = text('SELECT pg_current_wal_lsn()')
+LAG_QUERY = text('''
+    SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_replay_lsn() >= CAST(:primary_lsn AS pg_lsn) THEN 0
+                ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+           END
+''')
+
+
+class Replica:
+    def __init__(self, uri, options):
+        url = make_url(uri)
+        self.name = f'{url.host}:{url.port or 5432}/{url.database}'
+        poolclass = options.get('poolclass')
+        if isinstance(poolclass, type) and issubclass(poolclass, InstrumentedQueuePool):
+            poolclass = poolclass.labelled()
+            poolclass.stats.subscribe(self._record_checkout)
+            options = {**options, 'poolclass': poolclass}
+        self.engine = create_engine(url, **options)
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+
+    def _record_checkout(self, seconds, timed_out):
+        REPLICA_POOL_WAIT.labels(self.name).observe(seconds)
+        if timed_out:
+            REPLICA_POOL_TIMEOUTS.labels(self.name).inc()
+
+    def snapshot(self):
+        return {'name': self.name, 'healthy': self.healthy, 'lag_seconds': self.lag, 'error': self.error,
+                'checked_at': self.checked_at, 'pool': pool_stats(self.engine)}
+
+
+class ReplicaSet:
+    """The read replicas of SQLALCHEMY_REPLICA_URIS and their health."""
+
+    def __init__(self, app=None, db=None):
+        self.replicas = []
+        self._pid = None
+        self._pid_lock = threading.Lock()
+        self._turn = itertools.count()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('REPLICA_MAX_LAG_SECONDS', 5)
+        app.config.setdefault('REPLICA_CHECK_INTERVAL', 2)
+        app.extensions['replicas'] = self
+        self.db = db
+        # Same pool sizing and timeouts as the primary
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        self.replicas = [Replica(uri, options) for uri in app.config['SQLALCHEMY_REPLICA_URIS']]
+        self.max_lag = app.config['REPLICA_MAX_LAG_SECONDS']
+        self.interval = app.config['REPLICA_CHECK_INTERVAL']
+        if self.replicas:
+            app.after_request(self._after_request)
+
+    def pick(self):
+        """Engine of the next healthy replica, or None to use the primary."""
+        if not self.replicas:
+            return None
+        self._ensure_checker()
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)].engine
+
+    def snapshot(self):
+        self._ensure_checker()
+        return {
+            'max_lag_seconds': self.max_lag,
+            'replicas': [replica.snapshot() for replica in self.replicas],
+        }
+
+    def _ensure_checker(self):
+        # One checker per process: the thread does not survive a gunicorn fork
+        if self._pid != os.getpid():
+            with self._pid_lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    for replica in self.replicas:
+                        replica.healthy = False
+                    threading.Thread(target=self._check_forever, args=(self.db.engine,), name='replica-checker',
+                                     daemon=True).start()
+
+    def _check_forever(self, primary_engine):
+        while True:
+            try:
+                with primary_engine.connect() as conn:
+                    primary_lsn = conn.execute(PRIMARY_LSN_QUERY).scalar()
+            except Exception:
+                # Without the primary there is nothing to measure against; keep the last verdicts
+                logger.warning('Replica check could not reach the primary', exc_info=True)
+            else:
+                for replica in self.replicas:
+                    self._check(replica, primary_lsn)
+            time.sleep(self.interval)
+
+    def _check(self, replica, primary_lsn):
+        try:
+            with replica.engine.connect() as conn:
+                lag = conn.execute(LAG_QUERY, {'primary_lsn': primary_lsn}).scalar()
+            replica.lag = None if lag is None else round(float(lag), 3)
+            replica.error = None if lag is not None else 'Behind the primary, no transaction replayed yet'
+        except Exception as e:
+            replica.lag, replica.error = None, str(e).splitlines()[0]
+        healthy = replica.lag is not None and replica.lag <= self.max_lag
+        if healthy != replica.healthy:
+            logger.warning('Replica %s %s rotation (lag %s, %s)', replica.name, 'back in' if healthy else 'out of',
+                           replica.lag, replica.error or 'ok')
+        replica.healthy = healthy
+        replica.checked_at = time.time()
+        REPLICA_LAG.labels(replica.name).set(math.nan if replica.lag is None else replica.lag)
+        REPLICA_HEALTHY.labels(replica.name).set(int(healthy))
+
+    def _after_request(self, response):
+        session = current_app.extensions['sqlalchemy'].session
+        if session.registry.has() and session().info.get('wrote'):
+            # Long enough for any replica still in rotation to have caught up
+            seconds = math.ceil(self.max_lag + self.interval)
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+replicas = ReplicaSet()
+
+
+def _replica_safe(clause):
+    return isinstance(clause, (Select, CompoundSelect)) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """Session that sends the plain reads of read-only blocks to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        read_only = self.info.get('read_only')
+        # text() may write; only read-only blocks are trusted not to
+        if self._flushing or isinstance(clause, UpdateBase) or isinstance(clause, TextClause) and not read_only:
+            self.info['wrote'] = True
+        elif bind is None and read_only and not self.info.get('wrote') and _replica_safe(clause):
+            # Decided once per session (None meaning the primary), so all of
+            # its reads see the same server
+            if 'replica' not in self.info:
+                self.info['replica'] = replicas.pick()
+            if self.info['replica'] is not None:
+                return self.info['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def _routing(read_only):
+    session = current_app.extensions['sqlalchemy'].session()
+    previous = session.info.get('read_only', False)
+    session.info['read_only'] = read_only
+    try:
+        yield
+    finally:
+        session.info['read_only'] = previous
+
+
+def reading():
+    """Send the plain SELECTs of the enclosed block to a replica."""
+    return _routing(True)
+
+
+def primary():
+    """Keep the enclosed block on the primary, even inside reading()."""
+    return _routing(False)
+
+
+def routed(generator):
+    """Run `generator` under the routing in force now.
+
+    A streamed body is produced after the view, and so after its reading()
+    block, has returned; without this its reads would go to the primary.
+    Wrap the result in stream_with_context to keep the same session.
+    """
+    read_only = current_app.extensions['sqlalchemy'].session().info.get('read_only', False)
+
+    def run():
+        with _routing(read_only):
+            yield from generator
+    return run()
+
+
+def may_read_replica():
+    """Whether plain reads of the current session may be served by a replica."""
+    info = current_app.extensions['sqlalchemy'].session().info
+    return bool(replicas.replicas) and info.get('read_only') and not info.get('wrote')
+
+
+def wrote_recently():
+    """Whether the client holds the cookie set after its last write."""
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_only(view):
+    """Serve the view's plain reads from a replica, unless its client wrote recently."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if wrote_recently():
+            return view(*args, **kwargs)
+        with reading():
+            return view(*args, **kwargs)
+    return wrapped
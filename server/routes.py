@@ -1,5 +1,29 @@
-from flask import Blueprint, jsonify
-from models import User
+"""The API, registered by create_app() in app.py."""
+import shutil
+import uuid
+
+from flask import Blueprint, Response, current_app, jsonify, request, send_from_directory, stream_with_context
+from sqlalchemy import cast, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only, raiseload
+
+from models import Asset, AssetStatus, Category, Job, JobStatus, Request, RequestHistory, RequestStatus, User
+from database import db
+import asset_import
+import dashboard
+import jobs
+import tasks
+from db_pool import pool_stats
+from sql_debug import query_budget
+from cache import ALL, cache
+from conditional import conditional
+from replicas import read_only, replicas, routed
+from pagination import (
+    PaginationError, STREAM_CHUNK_SIZE, apply_keyset, decode_offset, encode_cursor, iter_ndjson, parse_limit, split_page,
+)
+from search import MAX_QUERY_LENGTH, asset_search
+from queries import REQUEST_INCLUDES, asset_filters, parse_includes, request_filters, serialize_request
+
 
 routes_bp = Blueprint('routes', __name__)
 
@@ -8,13 +32,390 @@ def get_api():
     return jsonify({'message': 'Welcome to the API!'})
 
 @routes_bp.route('/api/users', methods=['GET'])
+@read_only
+@query_budget(2)
+@conditional('user')
 def get_users():
-    users = User.query.all()
-    return jsonify([user.serialize for user in users])
+    after = request.args.get('after')
+    try:
+        serializer = User.serializer.only(request.args.get('fields'))
+        # Column-only query: rows are plain tuples, no ORM instances are built
+        rows = db.session.query(*serializer.columns_with([User.id]))
+        limit = parse_limit(request.args.get('limit'))
+        if request.args.get('stream') == 'ndjson':
+            # Server-side cursor: rows are fetched and flushed in chunks
+            query = apply_keyset(rows, [User.id], after, limit=None).yield_per(STREAM_CHUNK_SIZE)
+            return Response(stream_with_context(routed(iter_ndjson(query, serializer.dump_row))),
+                            mimetype='application/x-ndjson')
+        query = apply_keyset(rows, [User.id], after, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    users, next_cursor = split_page(query.all(), limit, key=lambda row: (row.id,))
+    return jsonify({'data': [serializer.dump_row(row) for row in users], 'next_cursor': next_cursor})
 
 @routes_bp.route('/api/users/<int:user_id>', methods=['GET'])
+@read_only
+@query_budget(2)
+@conditional('user')
 def get_user(user_id):
-    user = User.query.get(user_id)
+    try:
+        serializer = User.serializer.only(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    user = cache.get('user', user_id, lambda: load_user(user_id))
     if user is None:
         return jsonify({'error': 'User not found'}), 404
-    return jsonify(user.serialize)
\ No newline at end of file
+    # The cache holds whole rows, so a subset is picked from memory
+    return jsonify(serializer.trim(user))
+
+def load_user(user_id):
+    row = db.session.query(*User.serializer.columns).filter(User.id == user_id).first()
+    return None if row is None else User.serializer.dump_row(row)
+
+def load_category(category_id):
+    row = db.session.query(*Category.serializer.columns).filter(Category.id == category_id).first()
+    return None if row is None else Category.serializer.dump_row(row)
+
+def load_categories():
+    rows = db.session.query(*Category.serializer.columns).order_by(Category.id)
+    return [Category.serializer.dump_row(row) for row in rows]
+
+@routes_bp.route('/api/categories', methods=['GET'])
+@read_only
+@query_budget(2)
+@conditional('category')
+def get_categories():
+    try:
+        serializer = Category.serializer.only(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    categories = cache.get('category', ALL, load_categories)
+    if serializer is not Category.serializer:
+        categories = [serializer.trim(category) for category in categories]
+    return jsonify({'data': categories})
+
+@routes_bp.route('/api/categories/<int:category_id>', methods=['GET'])
+@read_only
+@query_budget(2)
+@conditional('category')
+def get_category(category_id):
+    try:
+        serializer = Category.serializer.only(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    category = cache.get('category', category_id, lambda: load_category(category_id))
+    if category is None:
+        return jsonify({'error': 'Category not found'}), 404
+    return jsonify(serializer.trim(category))
+
+def build_asset_query(args, serializer=Asset.serializer):
+    """Translate listing query-string filters into (query, keyset keys, descending)."""
+    criteria, keys, descending = asset_filters(args)
+    return db.session.query(*serializer.columns_with(keys)).filter(*criteria), keys, descending
+
+@routes_bp.route('/api/assets', methods=['GET'])
+@read_only
+@query_budget(2)
+@conditional('asset')
+def get_assets():
+    try:
+        serializer = Asset.serializer.only(request.args.get('fields'))
+        query, keys, descending = build_asset_query(request.args, serializer)
+        limit = parse_limit(request.args.get('limit'))
+        query = apply_keyset(query, keys, request.args.get('after'), limit, descending)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    assets, next_cursor = split_page(
+        query.all(), limit, key=lambda row: tuple(getattr(row, k.key) for k in keys)
+    )
+    return jsonify({'data': [serializer.dump_row(row) for row in assets], 'next_cursor': next_cursor})
+
+@routes_bp.route('/api/assets/search', methods=['GET'])
+@read_only
+@query_budget(2)
+@conditional('asset')
+def search_assets():
+    q = (request.args.get('q') or '').strip()
+    if not q or len(q) > MAX_QUERY_LENGTH:
+        return jsonify({'error': f'q must be 1-{MAX_QUERY_LENGTH} characters'}), 400
+    try:
+        serializer = Asset.serializer.only(request.args.get('fields'))
+        limit = parse_limit(request.args.get('limit'), default=20, maximum=100)
+        offset = decode_offset(request.args.get('after'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows = db.session.execute(asset_search(q, serializer).limit(limit + 1).offset(offset)).all()
+    next_cursor = encode_cursor(offset + limit) if len(rows) > limit else None
+    data = []
+    for row in rows[:limit]:
+        item = serializer.dump_row(row)
+        item['score'] = round(row.score, 4)
+        data.append(item)
+    return jsonify({'data': data, 'next_cursor': next_cursor})
+
+@routes_bp.route('/api/assets/import', methods=['POST'])
+@query_budget(5)
+def import_assets():
+    fmt = asset_import.FORMATS.get(request.mimetype)
+    if fmt is None:
+        return jsonify({'error': 'Send the assets as text/csv or application/x-ndjson'}), 415
+    if request.args.get('background') == 'true':
+        # Spool the body for a worker; large files would outlive the request timeout
+        name = f'import-{uuid.uuid4().hex}.{fmt}'
+        with open(tasks.job_file(name), 'wb') as spool:
+            shutil.copyfileobj(request.stream, spool, 1 << 20)
+        return job_accepted(jobs.enqueue('assets.import', {'file': name, 'format': fmt}))
+    # request.stream is read line by line, never buffered whole
+    try:
+        report = asset_import.import_assets(request.stream, fmt)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    return jsonify(report)
+
+@routes_bp.route('/api/assets/export', methods=['POST'])
+@query_budget(1)
+def export_assets():
+    try:
+        tasks.export_options(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return job_accepted(jobs.enqueue('assets.export', request.args.to_dict()))
+
+def job_accepted(job):
+    db.session.commit()
+    response = jsonify(job.serialize)
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
+
+def is_id(value):
+    # JSON true/false arrive as bool, which is an int subclass
+    return isinstance(value, int) and not isinstance(value, bool)
+
+@routes_bp.route('/api/assets/allocate', methods=['POST'])
+@query_budget(1)
+def allocate_asset():
+    data = request.get_json(silent=True) or {}
+    user_id, asset_id, category_id = data.get('user_id'), data.get('asset_id'), data.get('category_id')
+    if not is_id(user_id) or not is_id(asset_id or category_id) or (asset_id and category_id):
+        return jsonify({'msg': 'user_id and exactly one of asset_id or category_id are required'}), 400
+
+    # Claim in one statement: pick an available row nobody else is claiming
+    # (SKIP LOCKED) and flip it, so concurrent allocations never wait on each
+    # other or hand out the same asset twice.
+    candidate = select(Asset.id).where(Asset.status == AssetStatus.Available)
+    if asset_id:
+        candidate = candidate.where(Asset.id == asset_id)
+    else:
+        candidate = candidate.where(Asset.category_id == category_id).order_by(Asset.id).limit(1)
+    claim = (
+        update(Asset)
+        .where(Asset.id == candidate.with_for_update(skip_locked=True).scalar_subquery(),
+               Asset.status == AssetStatus.Available)
+        .values(status=AssetStatus.Allocated, allocated_to=user_id, updated_at=func.now())
+        .returning(*Asset.serializer.columns)
+    )
+    try:
+        row = db.session.execute(claim).first()
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'msg': 'User not found'}), 404
+    if row is None:
+        return jsonify({'msg': 'No available asset'}), 409
+    return jsonify(Asset.serializer.dump_row(row))
+
+@routes_bp.route('/api/assets/<int:asset_id>/release', methods=['POST'])
+@query_budget(2)
+def release_asset(asset_id):
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    if user_id is not None and not is_id(user_id):
+        return jsonify({'msg': 'user_id must be an integer'}), 400
+    release = (
+        update(Asset)
+        .where(Asset.id == asset_id, Asset.status == AssetStatus.Allocated)
+        .values(status=AssetStatus.Available, allocated_to=None, updated_at=func.now())
+        .returning(*Asset.serializer.columns)
+    )
+    if user_id is not None:
+        # Only let the current holder give it back
+        release = release.where(Asset.allocated_to == user_id)
+    row = db.session.execute(release).first()
+    db.session.commit()
+    if row is None:
+        # Only failed releases pay for telling a missing asset from a conflict
+        if db.session.get(Asset, asset_id) is None:
+            return jsonify({'msg': 'Asset not found'}), 404
+        return jsonify({'msg': 'Asset is not allocated' if user_id is None else 'Asset is not allocated to this user'}), 409
+    return jsonify(Asset.serializer.dump_row(row))
+
+# The validator covers every table ?include= can pull in
+@routes_bp.route('/api/requests', methods=['GET'])
+@read_only
+@query_budget(3)
+@conditional('request', 'request_history', 'user', 'asset', 'category')
+def get_requests():
+    try:
+        includes = parse_includes(request.args.get('include'))
+        serializer = Request.serializer.only(request.args.get('fields'))
+        query = Request.query.filter(*request_filters(request.args))
+        # Anything not explicitly included raises instead of lazy loading per row
+        query = query.options(*(REQUEST_INCLUDES[name]() for name in includes), raiseload('*'))
+        if serializer is not Request.serializer:
+            query = query.options(load_only(*serializer.columns_with([Request.id]), raiseload=True))
+        limit = parse_limit(request.args.get('limit'))
+        query = apply_keyset(query, [Request.id], request.args.get('after'), limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    requests_, next_cursor = split_page(query.all(), limit, key=lambda req: (req.id,))
+    return jsonify({
+        'data': [serialize_request(req, includes, serializer) for req in requests_],
+        'next_cursor': next_cursor,
+    })
+
+MAX_BULK_DECISIONS = 1000
+
+@routes_bp.route('/api/requests/decisions', methods=['POST'])
+@query_budget(2)
+def decide_requests():
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    target = data.get('status')
+    comments = data.get('comments')
+
+    if target not in ('Approved', 'Rejected'):
+        return jsonify({'msg': 'status must be Approved or Rejected'}), 400
+    if (not isinstance(ids, list) or not ids or len(ids) > MAX_BULK_DECISIONS
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+        return jsonify({'msg': f'ids must be a list of 1-{MAX_BULK_DECISIONS} integers'}), 400
+    ids = sorted(set(ids))
+    target = RequestStatus[target]
+
+    # One statement: lock the still-pending rows nobody else holds, flip them
+    # and write their history rows. Rows locked by a concurrent decision are
+    # skipped rather than waited on, so two managers never block each other.
+    locked = (
+        select(Request.id)
+        .where(Request.id.in_(ids), Request.status == RequestStatus.Pending)
+        .order_by(Request.id)
+        .with_for_update(skip_locked=True)
+        .cte('locked')
+    )
+    decided = (
+        update(Request)
+        .where(Request.id.in_(select(locked.c.id)))
+        .values(status=target, updated_at=func.now())
+        .returning(Request.id)
+        .cte('decided')
+    )
+    logged = insert(RequestHistory).from_select(
+        ['request_id', 'status', 'comments', 'created_at', 'updated_at'],
+        select(decided.c.id, cast(literal(target.value), RequestHistory.status.type),
+               literal(comments), func.now(), func.now()),
+    ).cte('logged')
+    updated = set(db.session.execute(select(decided.c.id).add_cte(logged)).scalars())
+
+    # Explain the rest with a plain (non-locking) read
+    remaining = [i for i in ids if i not in updated]
+    current = dict(db.session.query(Request.id, Request.status).filter(Request.id.in_(remaining))) if remaining else {}
+    db.session.commit()
+
+    results = []
+    for request_id in ids:
+        if request_id in updated:
+            results.append({'id': request_id, 'outcome': 'updated', 'status': target.value})
+        elif request_id not in current:
+            results.append({'id': request_id, 'outcome': 'not_found'})
+        elif current[request_id] == RequestStatus.Pending:
+            # Held by a concurrent decision that has not committed yet
+            results.append({'id': request_id, 'outcome': 'locked', 'status': 'Pending'})
+        else:
+            results.append({'id': request_id, 'outcome': 'already_decided', 'status': current[request_id].value})
+    return jsonify({'updated': len(updated), 'results': results})
+
+@routes_bp.route('/api/requests/<int:request_id>/history', methods=['GET'])
+@read_only
+@query_budget(3)
+@conditional('request', 'request_history')
+def get_request_history(request_id):
+    serializer = RequestHistory.serializer
+    # Served in order straight from ix_request_history_request_id_created_at
+    keys = [RequestHistory.created_at, RequestHistory.id]
+    query = db.session.query(*serializer.columns).filter(RequestHistory.request_id == request_id)
+    after = request.args.get('after')
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        query = apply_keyset(query, keys, after, limit)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    entries, next_cursor = split_page(query.all(), limit, key=lambda row: (row.created_at, row.id))
+    if not entries and not after and db.session.query(Request.id).filter_by(id=request_id).first() is None:
+        return jsonify({'error': 'Request not found'}), 404
+    return jsonify({'data': [serializer.dump_row(row) for row in entries], 'next_cursor': next_cursor})
+
+@routes_bp.route('/api/dashboard/summary', methods=['GET'])
+@read_only
+@query_budget(3)
+@conditional('asset', 'request', 'category')
+def get_dashboard_summary():
+    return jsonify(dashboard.summary(cache.get('category', ALL, load_categories)))
+
+@routes_bp.route('/api/jobs', methods=['GET'])
+@query_budget(1)
+def get_jobs():
+    query = db.session.query(*Job.serializer.columns)
+    status, kind = request.args.get('status'), request.args.get('kind')
+    try:
+        if status:
+            if status not in JobStatus.__members__:
+                raise ValueError(f'Unknown status: {status}')
+            query = query.filter(Job.status == JobStatus[status])
+        if kind:
+            query = query.filter(Job.kind == kind)
+        limit = parse_limit(request.args.get('limit'))
+        # Newest first
+        query = apply_keyset(query, [Job.id], request.args.get('after'), limit, descending=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    jobs_, next_cursor = split_page(query.all(), limit, key=lambda row: (row.id,))
+    return jsonify({'data': [Job.serializer.dump_row(row) for row in jobs_], 'next_cursor': next_cursor})
+
+@routes_bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+@query_budget(1)
+def get_job(job_id):
+    row = db.session.query(*Job.serializer.columns).filter(Job.id == job_id).first()
+    if row is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(Job.serializer.dump_row(row))
+
+@routes_bp.route('/api/jobs/<int:job_id>/file', methods=['GET'])
+@query_budget(1)
+def get_job_file(job_id):
+    job = db.session.query(Job.status, Job.result).filter(Job.id == job_id).first()
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status is not JobStatus.Succeeded or not (job.result or {}).get('file'):
+        return jsonify({'error': 'Job has no file to download'}), 409
+    return send_from_directory(current_app.config['JOB_FILES_DIR'], job.result['file'], as_attachment=True,
+                               mimetype=tasks.EXPORT_FORMATS.get(job.result.get('format')))
+
+@routes_bp.route('/api/health/pool', methods=['GET'])
+def get_pool_health():
+    return jsonify(pool_stats(db.engine))
+
+@routes_bp.route('/api/health/replicas', methods=['GET'])
+def get_replica_health():
+    return jsonify(replicas.snapshot())
+
+@routes_bp.route('/api/health/cache', methods=['GET'])
+def get_cache_health():
+    return jsonify(cache.snapshot())
@@ -0,0 +1,33 @@
+from sqlalchemy import func, or_, select
+
+from models import Asset
+
+MAX_QUERY_LENGTH = 200
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def asset_search(q, serializer=Asset.serializer):
+    """Ranked asset search statement for the user query `q`, selecting the
+    columns of `serializer` followed by the score.
+
+    Matches either the weighted tsvector (name ranks above description) or,
+    for typos and partially typed names, the trigram index on name. Both
+    predicates are GIN-indexed so Postgres combines them with a BitmapOr.
+    """
+    tsquery = func.websearch_to_tsquery('english', q)
+    score = func.greatest(
+        func.ts_rank_cd(Asset.search_vector, tsquery),
+        func.similarity(Asset.name, q),
+    ).label('score')
+    return (
+        select(*serializer.columns, score)
+        .where(or_(
+            Asset.search_vector.op('@@')(tsquery),
+            Asset.name.op('%')(q),
+            Asset.name.ilike(_escape_like(q) + '%', escape='\\'),
+        ))
+        .order_by(score.desc(), Asset.id)
+    )
@@ -1,157 +1,210 @@
-from datetime import datetime, timezone
-from app import db  
-from models import User, Asset, Category, Request, RequestHistory, UserRole, AssetStatus, RequestType, UrgencyLevel, RequestStatus
-
-# Create sample categories
-categories = [
-    Category(category_name='Electronics', description='Electronic devices such as laptops, desktops, etc.'),
-    Category(category_name='Furniture', description='Office furniture including desks, chairs, etc.'),
-    Category(category_name='Stationery', description='Office stationery such as pens, paper, etc.')
-]
+"""Deterministic synthetic dataset for development and performance work.
 
-# Create sample users with timezone-aware timestamps for created_at field
-users = [
-    User(
-        username='john_doe', 
-        password='password123', 
-        role=UserRole.Admin, 
-        email='john@example.com', 
-        created_at=datetime.now(timezone.utc)
-    ),
-    User(
-        username='jane_smith', 
-        password='password456', 
-        role=UserRole.Procurement_Manager, 
-        email='jane@example.com', 
-        created_at=datetime.now(timezone.utc)
-    ),
-    User(
-        username='alice_walker', 
-        password='password789', 
-        role=UserRole.Employee, 
-        email='alice@example.com', 
-        created_at=datetime.now(timezone.utc) 
-    )
-]
+    flask seed --users 100000 --assets 1000000 --requests 2000000
 
-# Create sample assets
-assets = [
-    Asset(
-        name='Dell Laptop', 
-        description='14-inch, 8GB RAM, Intel i5 processor laptop.', 
-        status=AssetStatus.Available, 
-        image_url='https://example.com/images/dell-laptop.jpg',
-        created_at=datetime.now(timezone.utc)
-    ),
-    Asset(
-        name='Office Chair', 
-        description='Ergonomic chair with lumbar support.', 
-        status=AssetStatus.Allocated, 
-        image_url='https://example.com/images/office-chair.jpg', 
-        allocated_to=1,  # Allocated to John Doe
-        created_at=datetime.now(timezone.utc) 
-    ),
-    Asset(
-        name='Projector', 
-        description='4K resolution projector for office presentations.', 
-        status=AssetStatus.Under_Repair, 
-        image_url='https://example.com/images/projector.jpg',
-        created_at=datetime.now(timezone.utc) 
-    ),
-    Asset(
-        name='Samsung Monitor', 
-        description='27-inch curved monitor, 4K resolution.', 
-        status=AssetStatus.Available, 
-        image_url='https://example.com/images/samsung-monitor.jpg',
-        created_at=datetime.now(timezone.utc)
-    ),
-    Asset(
-        name='Desk Lamp', 
-        description='Adjustable LED desk lamp.', 
-        status=AssetStatus.Available, 
-        image_url='https://example.com/images/desk-lamp.jpg',
-        created_at=datetime.now(timezone.utc) 
-    )
-]
+The same options and --seed always produce the same rows. Rows are appended
+after the current maximum ids and streamed into Postgres with COPY in batches
+of --batch-size, so millions of rows load in minutes with flat memory use.
+"""
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
 
-# Create sample requests with timezone-aware timestamps
-requests = [
-    Request(
-        user_id=2, 
-        asset_id=None, 
-        request_type=RequestType.New_Asset, 
-        reason='New laptop needed for work.', 
-        quantity=1, 
-        urgency=UrgencyLevel.High, 
-        status=RequestStatus.Pending,
-        created_at=datetime.now(timezone.utc)
-    ),
-    Request(
-        user_id=3, 
-        asset_id=4, 
-        request_type=RequestType.Repair, 
-        reason='Monitor screen flickering.', 
-        quantity=1, 
-        urgency=UrgencyLevel.Medium, 
-        status=RequestStatus.Pending,
-        created_at=datetime.now(timezone.utc)
-    ),
-    Request(
-        user_id=1, 
-        asset_id=2, 
-        request_type=RequestType.Repair, 
-        reason='Chair has a broken wheel.', 
-        quantity=1, 
-        urgency=UrgencyLevel.Low, 
-        status=RequestStatus.Approved,
-        created_at=datetime.now(timezone.utc)
-    )
-]
+from sqlalchemy import func, text
+
+from database import db
+from db_copy import copy_rows
+from hashing import hasher
+from models import (
+    Asset, AssetStatus, Category, Request, RequestHistory, RequestStatus, RequestType, UrgencyLevel, User,
+    UserRole,
+)
 
-# Create sample request histories with timezone-aware timestamps
-request_histories = [
-    RequestHistory(
-        request_id=1, 
-        status=RequestStatus.Pending, 
-        comments='Request created and awaiting approval.',
-        created_at=datetime.now(timezone.utc)
-    ),
-    RequestHistory(
-        request_id=2, 
-        status=RequestStatus.Pending, 
-        comments='Request created and awaiting repair.',
-        created_at=datetime.now(timezone.utc) 
-    ),
-    RequestHistory(
-        request_id=3, 
-        status=RequestStatus.Approved, 
-        comments='Request approved for repair.',
-        created_at=datetime.now(timezone.utc)
-    )
+CATEGORIES = [
+    ('Electronics', 'Laptops, desktops, phones and peripherals', ['Laptop', 'Monitor', 'Phone', 'Tablet', 'Dock']),
+    ('Furniture', 'Desks, chairs and storage', ['Desk', 'Chair', 'Cabinet', 'Shelf', 'Whiteboard']),
+    ('Stationery', 'Pens, paper and other office supplies', ['Stapler', 'Shredder', 'Label Printer']),
+    ('Networking', 'Switches, routers and access points', ['Switch', 'Router', 'Access Point', 'Firewall']),
+    ('Audio Visual', 'Projectors, cameras and conference kit', ['Projector', 'Webcam', 'Speakerphone', 'Headset']),
+    ('Vehicles', 'Pool cars and vans', ['Sedan', 'Van', 'Electric Scooter']),
+    ('Tools', 'Workshop and maintenance equipment', ['Drill', 'Ladder', 'Multimeter', 'Soldering Station']),
+    ('Servers', 'Rack hardware and storage', ['Rack Server', 'NAS', 'UPS']),
 ]
+BRANDS = ['Dell', 'HP', 'Lenovo', 'Apple', 'Samsung', 'Logitech', 'Cisco', 'Steelcase', 'IKEA', 'Bosch', 'Epson']
+ADJECTIVES = ['compact', 'refurbished', 'ergonomic', 'portable', 'heavy duty', 'wireless', 'spare', 'shared']
+REPAIR_REASONS = ['Stopped working', 'Broken part', 'Intermittent fault', 'Battery no longer charges',
+                  'Physical damage', 'Needs recalibration']
+NEW_REASONS = ['New joiner', 'Replacement for a retired asset', 'Project requirement', 'Team expansion']
+
+USER_ROLES = ([UserRole.Employee, UserRole.Procurement_Manager, UserRole.Admin], [95, 4, 1])
+ASSET_STATUSES = ([AssetStatus.Allocated, AssetStatus.Available, AssetStatus.Under_Repair], [60, 32, 8])
+REQUEST_STATUSES = ([RequestStatus.Approved, RequestStatus.Pending, RequestStatus.Rejected], [55, 30, 15])
+URGENCIES = ([UrgencyLevel.Low, UrgencyLevel.Medium, UrgencyLevel.High], [50, 35, 15])
+
+TABLES = ['category', '"user"', 'asset', 'request', 'request_history']
+
+# Row triggers that would send one NOTIFY per seeded row (migration 4e23267ffb87);
+# they are paused during the load and replaced by one table-wide NOTIFY.
+NOTIFY_TRIGGERS = {'user': 'cache_invalidate_user', 'category': 'cache_invalidate_category'}
+
+
+def _batches(n, batch_size):
+    for start in range(0, n, batch_size):
+        yield range(start, min(n, start + batch_size))
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _reset_sequence(table, sequence=None):
+    """Move `table`'s id sequence past the explicit ids COPY wrote."""
+    sequence = sequence or f"pg_get_serial_sequence('\"{table}\"', 'id')"
+    db.session.execute(text(f'SELECT setval({sequence}, (SELECT coalesce(max(id), 0) + 1 FROM "{table}"), false)'))
+
+
+class Generator:
+    """Produces coherent rows for every table from a single seeded RNG."""
+
+    def __init__(self, seed, start, days, password_hash):
+        self.rng = random.Random(seed)
+        self.start = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+        self.span = timedelta(days=days).total_seconds()
+        self.password_hash = password_hash
+        self.kinds = {}
+        self.user_ids = self.category_ids = self.asset_ids = range(0)
 
-# Insert data into the database
-def seed_data():
-    # Add categories to the database
-    db.session.add_all(categories)
-    db.session.commit() 
-
-    # Fetch category ids after they are inserted into the database
-    electronics_category = Category.query.filter_by(category_name='Electronics').first()
-    furniture_category = Category.query.filter_by(category_name='Furniture').first()
-    stationery_category = Category.query.filter_by(category_name='Stationery').first()
-
-    # Create and add assets
-    assets[0].category_id = electronics_category.category_id  
-    assets[1].category_id = furniture_category.category_id    
-    assets[2].category_id = electronics_category.category_id  
-    assets[3].category_id = electronics_category.category_id  
-    assets[4].category_id = furniture_category.category_id 
-
-    db.session.add_all(assets)
-    db.session.add_all(users)
-    db.session.add_all(requests)
-    db.session.add_all(request_histories)
+    def moment(self, after=None, within=None):
+        """A timestamp in the dataset's window, optionally shortly after `after`."""
+        if after is None:
+            return self.start + timedelta(seconds=self.rng.random() * self.span)
+        return after + timedelta(seconds=self.rng.random() * within)
+
+    def category(self, category_id, index):
+        name, description, kinds = CATEGORIES[index % len(CATEGORIES)]
+        if index >= len(CATEGORIES):
+            name = f'{name} {index // len(CATEGORIES) + 1}'
+        self.kinds[category_id] = kinds
+        created = self.moment()
+        return category_id, name, description, created, created
+
+    def user(self, user_id):
+        role = self.rng.choices(*USER_ROLES)[0]
+        created = self.moment()
+        username = f'user{user_id:07d}'
+        return user_id, username, self.password_hash, role, f'{username}@example.com', created, created
+
+    def asset(self, asset_id):
+        rng = self.rng
+        # Skew assets towards the first categories, like a real inventory
+        category_id = self.category_ids[min(int(rng.paretovariate(1.2)) - 1, len(self.category_ids) - 1)]
+        kind = rng.choice(self.kinds.get(category_id) or CATEGORIES[0][2])
+        brand = rng.choice(BRANDS)
+        status = rng.choices(*ASSET_STATUSES)[0]
+        holder = rng.choice(self.user_ids) if status is AssetStatus.Allocated else None
+        created = self.moment()
+        updated = self.moment(created, 90 * 86400)
+        return (
+            asset_id, f'{brand} {kind} {asset_id}', f'{rng.choice(ADJECTIVES).capitalize()} {brand} {kind.lower()}',
+            category_id, status, f'https://assets.example.com/{asset_id}.jpg', holder, created, updated,
+        )
+
+    def request(self, request_id, history_ids):
+        """One request row and the history chain that led to its current status."""
+        rng = self.rng
+        status = rng.choices(*REQUEST_STATUSES)[0]
+        if self.asset_ids and rng.random() < 0.7:
+            request_type, asset_id, reason = RequestType.Repair, rng.choice(self.asset_ids), rng.choice(REPAIR_REASONS)
+        else:
+            request_type, asset_id, reason = RequestType.New_Asset, None, rng.choice(NEW_REASONS)
+        created = self.moment()
+        history = [(next(history_ids), request_id, RequestStatus.Pending, created, 'Request submitted', created)]
+        updated = created
+        if status is not RequestStatus.Pending:
+            updated = self.moment(created, 14 * 86400)
+            history.append((next(history_ids), request_id, status, updated, f'Request {status.value.lower()}', updated))
+        row = (
+            request_id, rng.choice(self.user_ids), asset_id, request_type, reason, rng.randint(1, 3),
+            rng.choices(*URGENCIES)[0], status, created, updated,
+        )
+        return row, history
+
+
+def _load(cursor, table, columns, ids, make_row, batch_size):
+    started, loaded = time.perf_counter(), 0
+    for batch in _batches(len(ids), batch_size):
+        copy_rows(cursor, table, columns, (make_row(ids[i], i) for i in batch))
+        loaded += len(batch)
+    elapsed = time.perf_counter() - started
+    print(f'{table}: {loaded} rows in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):.0f}/s)')
+
+
+def generate(users=1000, categories=len(CATEGORIES), assets=10000, requests=10000,
+             seed=42, batch_size=50000, start=date(2025, 1, 1), days=365, password='password', truncate=False):
+    """Append a synthetic dataset and commit it. Every user gets `password`.
+
+    With `truncate`, every seeded table is emptied first, so ids start at 1
+    and the result is identical from run to run.
+    """
+    if assets and (categories < 1 or users < 1) or requests and users < 1:
+        raise ValueError('assets need categories and users to refer to; requests need users')
+
+    # Hashing once keeps millions of users from costing millions of scrypt runs
+    gen = Generator(seed, start, days, hasher.hash(password))
+    cursor = db.session.connection().connection.driver_connection.cursor()
+    if truncate:
+        # The dashboard counters only follow row changes, so they go too
+        db.session.execute(text(f'TRUNCATE {", ".join(TABLES)}, dashboard_counter RESTART IDENTITY'))
+    for table, trigger in NOTIFY_TRIGGERS.items():
+        db.session.execute(text(f'ALTER TABLE "{table}" DISABLE TRIGGER {trigger}'))
+    # History rows land in monthly partitions; make sure they all exist first
+    months = (days + 90) // 28 + 2
+    db.session.execute(text('SELECT request_history_ensure_partitions(:start, :months)'),
+                       {'start': start.replace(day=1), 'months': months})
+
+    first = _next_id(Category)
+    gen.category_ids = range(first, first + categories)
+    _load(cursor, 'category', ['id', 'category_name', 'description', 'created_at', 'updated_at'],
+          gen.category_ids, lambda id_, i: gen.category(id_, i), batch_size)
+
+    first = _next_id(User)
+    gen.user_ids = range(first, first + users)
+    _load(cursor, 'user', ['id', 'username', 'password', 'role', 'email', 'created_at', 'updated_at'],
+          gen.user_ids, lambda id_, i: gen.user(id_), batch_size)
+
+    first = _next_id(Asset)
+    gen.asset_ids = range(first, first + assets)
+    _load(cursor, 'asset', ['id', 'name', 'description', 'category_id', 'status', 'image_url', 'allocated_to',
+                            'created_at', 'updated_at'],
+          gen.asset_ids, lambda id_, i: gen.asset(id_), batch_size)
+
+    # Requests and their history are generated together, one batch at a time
+    started = time.perf_counter()
+    first = _next_id(Request)
+    history_ids = iter(range(_next_id(RequestHistory), 2**31))
+    history_count = 0
+    for batch in _batches(requests, batch_size):
+        rows, history = [], []
+        for i in batch:
+            row, chain = gen.request(first + i, history_ids)
+            rows.append(row)
+            history.extend(chain)
+        copy_rows(cursor, 'request', ['id', 'user_id', 'asset_id', 'request_type', 'reason', 'quantity',
+                                      'urgency', 'status', 'created_at', 'updated_at'], rows)
+        copy_rows(cursor, 'request_history', ['id', 'request_id', 'status', 'updated_at', 'comments',
+                                              'created_at'], history)
+        history_count += len(history)
+    elapsed = time.perf_counter() - started
+    print(f'request: {requests} rows, request_history: {history_count} rows in {elapsed:.1f}s')
+
+    for table in ('category', 'user', 'asset', 'request'):
+        _reset_sequence(table)
+    _reset_sequence('request_history', "'request_history_id_seq'")
+    for table, trigger in NOTIFY_TRIGGERS.items():
+        db.session.execute(text(f'ALTER TABLE "{table}" ENABLE TRIGGER {trigger}'))
+        db.session.execute(text("SELECT pg_notify('cache_invalidate', :table)"), {'table': table})
     db.session.commit()
 
-    print("Database seeded successfully.")
+    for table in TABLES:
+        db.session.execute(text(f'ANALYZE {table}'))
+    db.session.commit()
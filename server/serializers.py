@@ -0,0 +1,118 @@
+import json
+from datetime import date
+from enum import Enum
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import DateTime, Enum as SAEnum, select
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+class Serializer:
+    """Field spec for a model, compiled once into straight-line dict builders.
+
+    `dump(obj)` reads attributes off an ORM instance; `dump_row(row)` reads
+    positions off a result tuple from `select(*serializer.columns)`, which
+    skips building ORM instances altogether. Enum and datetime columns are
+    converted inline so the resulting dicts only hold plain JSON types.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+        self.columns = tuple(getattr(model, name) for name in self.fields)
+        self.dump = self._compile('obj.{name}')
+        self.dump_row = self._compile('row[{index}]', argument='row')
+        self._subsets = {}
+
+    def _compile(self, accessor, argument='obj'):
+        items = []
+        for index, (name, column) in enumerate(zip(self.fields, self.columns)):
+            value = accessor.format(name=name, index=index)
+            column_type = column.property.columns[0].type
+            if isinstance(column_type, SAEnum):
+                value = f'(None if {value} is None else {value}.value)'
+            elif isinstance(column_type, DateTime):
+                value = f'(None if {value} is None else {value}.isoformat())'
+            items.append(f'{name!r}: {value}')
+        source = f'def dump({argument}):\n    return {{{", ".join(items)}}}\n'
+        namespace = {}
+        exec(compile(source, f'<serializer {self.model.__name__}>', 'exec'), namespace)
+        return namespace['dump']
+
+    def select(self):
+        """Column-only SELECT whose rows feed `dump_row`."""
+        return select(*self.columns)
+
+    def only(self, value):
+        """Serializer for the comma separated `?fields=` subset in `value`.
+
+        Fields keep this serializer's order, so every spelling of a subset
+        shares one compiled instance. An empty value means every field and
+        unknown names raise ValueError.
+        """
+        names = {name.strip() for name in (value or '').split(',') if name.strip()}
+        if not names:
+            return self
+        unknown = names.difference(self.fields)
+        if unknown:
+            raise ValueError(f"Unknown field: {', '.join(sorted(unknown))}")
+        fields = tuple(name for name in self.fields if name in names)
+        subset = self._subsets.get(fields)
+        if subset is None:
+            subset = self._subsets[fields] = Serializer(self.model, fields)
+        return subset
+
+    def columns_with(self, keys):
+        """`columns` plus whichever of `keys` they lack, appended at the end so
+        `dump_row` positions still line up. Keyset pages need their sort keys
+        even when the client did not ask for them."""
+        return self.columns + tuple(key for key in keys if key.key not in self.fields)
+
+    def trim(self, data):
+        """This serializer's fields out of a full dict, e.g. a cached one."""
+        return {name: data[name] for name in self.fields}
+
+
+def _default(o):
+    if isinstance(o, Enum):
+        return o.value
+    if isinstance(o, date):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+
+def to_json(obj):
+    """`obj` as compact UTF-8 JSON bytes, encoded the same way as FastJSONProvider."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes enums by value and datetimes as ISO 8601.
+
+    Uses orjson when it is installed and falls back to the stdlib encoder.
+    """
+
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=_default).decode()
+        kwargs.setdefault('default', _default)
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=_default), mimetype=self.mimetype)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
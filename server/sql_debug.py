@@ -0,0 +1,161 @@
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Expanded IN lists render one placeholder per value; collapse them so
+# `IN (%(id_1_1)s, %(id_1_2)s)` and a three-value list share a shape.
+_IN_LIST = re.compile(r'IN \((?:%\(\w+\)s(?:, )?)+\)')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A route or block issued more SQL statements than it declared."""
+
+
+def statement_shape(statement):
+    return _IN_LIST.sub('IN (...)', ' '.join(statement.split()))
+
+
+def call_site():
+    """Innermost frame of our own code that led to the current statement."""
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(APP_DIR) and 'site-packages' not in filename and filename != __file__:
+            return f'{os.path.relpath(filename, APP_DIR)}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+def query_budget(limit):
+    """Declare the most SQL statements a view may issue per request."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """Fail if the enclosed block issues more than `limit` statements.
+
+    Works without SQL_DEBUG; `flask check_query_budgets` runs every GET
+    route's budget through it::
+
+        with assert_max_queries(2):
+            client.get('/api/requests?include=user')
+
+    Only statements from the calling thread count, not those of background
+    threads such as the replica checker.
+    """
+    statements = []
+    thread = threading.get_ident()
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count)
+    if len(statements) > limit:
+        raise QueryBudgetExceeded(
+            f'{len(statements)} queries issued, budget is {limit}:\n' + '\n'.join(statements)
+        )
+
+
+class SQLDebugger:
+    """Opt-in (SQL_DEBUG) slow-query log, N+1 detector and per-route query budgets.
+
+    Meant for development and canary instances: it hooks every statement and
+    walks the stack when it finds something to report.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_DEBUG', False)
+        app.config.setdefault('SQL_SLOW_QUERY_MS', 200)
+        app.config.setdefault('SQL_N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('SQL_QUERY_BUDGET_STRICT', False)
+        app.extensions['sql_debug'] = self
+        if not app.config['SQL_DEBUG']:
+            return
+
+        self.app = app
+        self.slow_seconds = app.config['SQL_SLOW_QUERY_MS'] / 1000
+        self.repeat_threshold = app.config['SQL_N_PLUS_ONE_THRESHOLD']
+        self.strict = app.config['SQL_QUERY_BUDGET_STRICT']
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(Engine, 'handle_error', self._handle_error)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _route(self):
+        if not has_request_context():
+            return 'outside request'
+        return f'{request.method} {request.url_rule.rule if request.url_rule else request.path}'
+
+    def _before_request(self):
+        g.sql_shapes = Counter()
+        g.sql_reported = set()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('sql_debug_start', []).append(time.perf_counter())
+        if not has_request_context() or 'sql_shapes' not in g:
+            return
+        shape = statement_shape(statement)
+        g.sql_shapes[shape] += 1
+        if g.sql_shapes[shape] >= self.repeat_threshold and shape not in g.sql_reported:
+            g.sql_reported.add(shape)
+            logger.warning(
+                'Possible N+1 on %s: same query issued %d times, from %s\n%s',
+                self._route(), g.sql_shapes[shape], call_site(), shape,
+            )
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('sql_debug_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if elapsed >= self.slow_seconds:
+            logger.warning(
+                'Slow query (%.1f ms) on %s from %s\n%s\nparameters: %.500r',
+                elapsed * 1000, self._route(), call_site(), statement, parameters,
+            )
+
+    def _handle_error(self, context):
+        starts = context.connection.info.get('sql_debug_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    def _after_request(self, response):
+        if 'sql_shapes' not in g:
+            return response
+        view = self.app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        issued = sum(g.sql_shapes.values())
+        if budget is not None and issued > budget:
+            message = f'{self._route()} issued {issued} queries, budget is {budget}'
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+sql_debugger = SQLDebugger()
@@ -0,0 +1,75 @@
+"""Job handlers for work too slow to run inside a request; see jobs.py."""
+import csv
+import os
+
+from flask import current_app
+
+import asset_import
+from database import db
+from jobs import JobFailed, handler, on_commit
+from models import Asset
+from pagination import STREAM_CHUNK_SIZE
+from queries import asset_filters
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def job_file(name):
+    """Path of `name` in JOB_FILES_DIR, which web and worker processes share."""
+    directory = current_app.config['JOB_FILES_DIR']
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(name))
+
+
+def export_options(args):
+    """(format, serializer, criteria, keys, descending) for an export, or ValueError."""
+    fmt = args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown format: {fmt}')
+    return (fmt, Asset.serializer.only(args.get('fields'))) + asset_filters(args)
+
+
+@handler('assets.export')
+def export_assets(job):
+    """Write the assets matching the /api/assets filters in the payload to a file."""
+    try:
+        fmt, serializer, criteria, keys, descending = export_options(job.payload)
+    except ValueError as e:
+        raise JobFailed(str(e))
+    order = [key.desc() if descending else key for key in keys]
+    rows = db.session.query(*serializer.columns).filter(*criteria).order_by(*order).yield_per(STREAM_CHUNK_SIZE)
+
+    name = f'assets-{job.id}.{fmt}'
+    path = job_file(name)
+    count = 0
+    # Written under a temporary name so a download never sees half a file
+    with open(path + '.part', 'w', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(serializer.fields)
+            for row in rows:
+                writer.writerow(serializer.dump_row(row).values())
+                count += 1
+        else:
+            dumps = current_app.json.dumps
+            for row in rows:
+                f.write(dumps(serializer.dump_row(row)) + '\n')
+                count += 1
+    os.replace(path + '.part', path)
+    return {'file': name, 'format': fmt, 'rows': count, 'bytes': os.path.getsize(path)}
+
+
+@handler('assets.import')
+def import_assets(job):
+    """Import a file spooled by POST /api/assets/import?background=true."""
+    path = job_file(job.payload['file'])
+    if not os.path.exists(path):
+        raise JobFailed('The uploaded file is gone')
+    with open(path, 'rb') as source:
+        try:
+            report = asset_import.import_assets(source, job.payload['format'])
+        except ValueError as e:
+            raise JobFailed(str(e))
+    # Kept until the rows are committed with the job's success, so a retry can read it again
+    on_commit(lambda: os.remove(path))
+    return report
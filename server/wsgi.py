@@ -0,0 +1,4 @@
+"""Entry point for WSGI servers; gunicorn serves wsgi:app (see gunicorn.conf.py)."""
+from app import create_app
+
+app = create_app(cli=False)